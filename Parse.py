@@ -1,13 +1,113 @@
-from Script_fetch_from_db import cursor_df as dataset
+import numpy as np
 import pandas as pd
 
-# print("Available columns:", dataset.columns)
+# Formats createdDate arrives in: BigQuery/cache text first, then the legacy spreadsheet export
+DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M']
 
-dataset['date_column'] = pd.to_datetime(dataset['createdDate'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
-dataset['date_column'] = dataset['date_column'].fillna(pd.to_datetime(dataset['createdDate'], format='%m/%d/%Y %H:%M', errors='coerce'))
+DEDUPE_WINDOW = pd.Timedelta(minutes=10)
 
-dataset['10min_window'] = dataset['date_column'].dt.floor('10min')
-deduped_data = dataset.sort_values(['customerNumber', 'date_column']).drop_duplicates(['customerNumber', '10min_window'], keep='first')
-deduped_data['date_column'] += pd.Timedelta(hours=5, minutes=30)
+# Dense per-key arrays are used while there are at most this many possible keys per row
+DENSE_KEYS_PER_ROW = 4
 
-print("Parsed")
\ No newline at end of file
+IST_OFFSET = pd.Timedelta(hours=5, minutes=30)
+
+
+def parse_created_dates(column):
+    """
+    createdDate as datetime64[ns]. Datetime columns pass through; text is parsed with the
+    first format and only the rows it could not read are tried with the next one.
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        if getattr(column.dt, 'tz', None) is not None:
+            column = column.dt.tz_convert('UTC').dt.tz_localize(None)
+        return column.astype('datetime64[ns]', copy=False)
+
+    parsed = pd.to_datetime(column, format=DATE_FORMATS[0], errors='coerce')
+    for date_format in DATE_FORMATS[1:]:
+        missing = parsed.isna() & column.notna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(column[missing], format=date_format, errors='coerce')
+    return parsed.astype('datetime64[ns]')
+
+
+def customer_categories(column):
+    """
+    customerNumber as a Categorical; categoricals pass through, anything else is hash-factorized
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.array
+    codes, uniques = pd.factorize(column)
+    return pd.Categorical.from_codes(codes, uniques)
+
+
+def first_booking_mask(customers, times, window=DEDUPE_WINDOW):
+    """
+    True for the earliest booking of each (customer, time window) pair, ties going to the earlier row.
+
+    Works on int64 customer codes and epoch nanoseconds without sorting anything:
+    each pair gets one integer key, and a scatter-min per key finds the earliest
+    time and then the first row holding it. Codes must be >= 0. NaT times share
+    one window per customer, like the old sort-based dedupe.
+    """
+    n_rows = len(times)
+    if n_rows == 0:
+        return np.zeros(0, dtype=bool)
+
+    valid = times != np.iinfo(np.int64).min
+    windows = times // window.value
+    first_window = windows[valid].min() if valid.any() else 0
+    windows -= first_window - 1
+    windows[~valid] = 0
+
+    # Dense keys when the (customer x window) space is small compared to the data, else hash them
+    span = int(windows.max()) + 1
+    n_keys = (int(customers.max()) + 1) * span
+    if n_keys <= max(DENSE_KEYS_PER_ROW * n_rows, 1 << 20):
+        keys = customers * span + windows
+    else:
+        keys, uniques = pd.factorize(customers * span + windows)
+        n_keys = len(uniques)
+
+    earliest = np.full(n_keys, np.iinfo(np.int64).max)
+    np.minimum.at(earliest, keys, times)
+    is_earliest = np.flatnonzero(times == earliest[keys])
+
+    # Row numbers fit in int32 for any realistic batch, which halves the largest array here
+    first_row = np.full(n_keys, n_rows, dtype=np.int32 if n_rows < np.iinfo(np.int32).max else np.int64)
+    np.minimum.at(first_row, keys[is_earliest], is_earliest.astype(first_row.dtype))
+
+    keep = np.zeros(n_rows, dtype=bool)
+    keep[first_row[first_row < n_rows]] = True
+    return keep
+
+
+def dedupe_mask(created, customers):
+    """
+    first_booking_mask for parsed createdDates and customer categories
+    """
+    # Null customers have code -1; shifted to 0 they dedupe as one customer, as the old groupby did
+    return first_booking_mask(customers.codes.astype(np.int64) + 1, created.to_numpy().view(np.int64))
+
+
+def parse_bookings(dataset):
+    """
+    Parse createdDate, drop repeat bookings by the same customer within a 10 minute
+    window (keeping the first) and shift timestamps to IST.
+
+    Returns the compact table the rest of the pipeline works on: IST `date_column`,
+    float32 `latitude`/`longitude` and the categorical `customerNumber`.
+    """
+    created = parse_created_dates(dataset['createdDate'])
+    customers = customer_categories(dataset['customerNumber'])
+    keep = dedupe_mask(created, customers)
+
+    deduped_data = pd.DataFrame({
+        'date_column': (created.to_numpy()[keep] + IST_OFFSET.to_timedelta64()),
+        'latitude': dataset['latitude'].to_numpy(dtype=np.float32)[keep],
+        'longitude': dataset['longitude'].to_numpy(dtype=np.float32)[keep],
+        'customerNumber': customers[keep],
+    })
+
+    print("Parsed")
+    return deduped_data
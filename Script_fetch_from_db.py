@@ -1,56 +1,469 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
-from google.cloud import bigquery
-from google.oauth2 import service_account
 from datetime import datetime, timedelta
-import json
-import streamlit as st
 
-# ✅ Set up credentials from secrets
-creds_dict = st.secrets["GOOGLE_CREDENTIALS"]
-credentials = service_account.Credentials.from_service_account_info(creds_dict)
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+TABLE = "`bigquarry-459611.snape_mongo_data.bookings_rides`"
+COLUMNS = ['createdDate', 'latitude', 'longitude', 'bookingDate', 'customerNumber']
+
+# Rolling window kept in the local cache (hours)
+WINDOW_HOURS = int(os.environ.get('SNAPE_FETCH_WINDOW_HOURS', 25))
+
+CACHE_PATH = os.environ.get(
+    'SNAPE_BOOKING_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'bookings'),
+)
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 
-# ✅ Initialize BigQuery client
-client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+# 'rows' downloads bookings and aggregates in Python, 'hourly' lets BigQuery return zone x hour counts
+FETCH_MODE = os.environ.get('SNAPE_FETCH_MODE', 'rows')
 
-# ⏳ Calculate time range (UTC)
-current_datetime = datetime.now()
-current_datetime_utc = current_datetime - timedelta(hours=5, minutes=30)
-prev_25_hours_utc = current_datetime_utc - timedelta(hours=25)
 
-start_time = prev_25_hours_utc.strftime('%Y-%m-%d %H:%M:%S')
-end_time = current_datetime_utc.strftime('%Y-%m-%d %H:%M:%S')
+def get_client():
+    """
+    BigQuery client built from the service account in Streamlit secrets
+    """
+    import streamlit as st
+    from google.cloud import bigquery
+    from google.oauth2 import service_account
 
-# 🧠 Your SQL query
-query = f"""
-SELECT 
+    # ✅ Set up credentials from secrets
+    creds_dict = st.secrets["GOOGLE_CREDENTIALS"]
+    credentials = service_account.Credentials.from_service_account_info(creds_dict)
+
+    # ✅ Initialize BigQuery client
+    return bigquery.Client(credentials=credentials, project=credentials.project_id)
+
+
+def build_query(start_time, end_time):
+    # 🧠 Only rows in [start_time, end_time]; the cache dedupes the overlap at start_time
+    return f"""
+SELECT
     createdDate,
     ST_Y(pickupGeoLocation) AS latitude,
     ST_X(pickupGeoLocation) AS longitude,
     bookingDate,
     customerNumber
-FROM `bigquarry-459611.snape_mongo_data.bookings_rides`
-WHERE createdDate >= '{start_time}' 
+FROM {TABLE}
+WHERE createdDate >= '{start_time}'
   AND createdDate <= '{end_time}'
 ORDER BY createdDate DESC
 """
 
-# 📦 Global variable to be used elsewhere
-cursor_df = pd.DataFrame()
 
-# 🚀 Execute query
-try:
-    query_job = client.query(query)
-    results = query_job.result()
-    
-    rows = [dict(row) for row in results]
-    cursor_df = pd.DataFrame(rows)
-    
-    if not cursor_df.empty:
-        cursor_df['customerNumber'] = cursor_df['customerNumber'].astype(str)
-        print("✅ Data fetched successfully.")
-        print(cursor_df)
-    else:
+def _typed_frame(df):
+    """
+    Native dtypes for the booking columns, with customerNumber as a categorical
+    """
+    df = df.reindex(columns=COLUMNS)
+    if not isinstance(df['customerNumber'].dtype, pd.CategoricalDtype):
+        df['customerNumber'] = df['customerNumber'].astype(str).astype('category')
+    return df
+
+
+def _arrow_to_frame(table):
+    """
+    Arrow table or record batch to pandas, dictionary-encoding customerNumber so it arrives as a categorical
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if 'customerNumber' in table.column_names:
+        i = table.column_names.index('customerNumber')
+        encoded = pc.dictionary_encode(pc.cast(table.column(i), pa.string()))
+        table = table.set_column(i, 'customerNumber', encoded)
+    return _typed_frame(table.to_pandas())
+
+
+def result_to_table(results):
+    """
+    Query results as an Arrow table of the booking columns.
+
+    Goes through the BigQuery Storage read API when available, so no per-row
+    Python dicts are built. Results without an Arrow interface, such as a
+    local fake client's rows, fall back to the row path.
+    """
+    import pyarrow as pa
+
+    if hasattr(results, 'to_arrow'):
+        table = results.to_arrow(create_bqstorage_client=True)
+        return table.select([name for name in COLUMNS if name in table.column_names])
+    return pa.Table.from_pandas(pd.DataFrame([dict(row) for row in results], columns=COLUMNS), preserve_index=False)
+
+
+def result_to_frame(results):
+    """
+    Query results as a typed DataFrame, customerNumber as a categorical
+    """
+    return _arrow_to_frame(result_to_table(results))
+
+
+def iter_booking_frames(client, start_time, end_time, bqstorage_client=None):
+    """
+    Stream bookings in [start_time, end_time] as typed DataFrames, one per Arrow record batch.
+    Memory stays bounded by the batch size on multi-day backfills.
+    """
+    results = client.query(build_query(start_time, end_time)).result()
+    if not hasattr(results, 'to_arrow_iterable'):
+        yield result_to_frame(results)
+        return
+    for batch in results.to_arrow_iterable(bqstorage_client=bqstorage_client):
+        yield _arrow_to_frame(batch)
+
+
+def _cache_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('createdDate', pa.timestamp('us')),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('bookingDate', pa.string()),
+        ('customerNumber', pa.string()),
+    ])
+
+
+def _cache_table(table):
+    """
+    Booking columns in the cache's fixed schema: createdDate as naive UTC timestamps
+    (text is parsed with TIME_FORMAT, rows it cannot read are dropped), the rest as
+    float64 and text. Every step is an Arrow kernel, no Python objects per row.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    schema = _cache_schema()
+    columns = []
+    for field in schema:
+        if field.name not in table.column_names:
+            columns.append(pa.nulls(table.num_rows, field.type))
+            continue
+        column = table.column(field.name)
+        if pa.types.is_dictionary(column.type):
+            column = pc.cast(column, column.type.value_type)
+        if field.name == 'createdDate' and (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+            column = pc.strptime(column, format=TIME_FORMAT, unit='us', error_is_null=True)
+        # tz-aware timestamps keep their UTC instant when the zone is dropped
+        columns.append(pc.cast(column, field.type))
+    table = pa.Table.from_arrays(columns, schema=schema)
+    return table.filter(pc.is_valid(table.column('createdDate')))
+
+
+SEGMENT_TIME_FORMAT = '%Y%m%dT%H%M%S%f'
+
+# Columns identifying a booking; a refetched row equal on all of them is not stored twice
+BOOKING_KEY = ['createdDate', 'customerNumber', 'latitude', 'longitude']
+
+# Segments kept before evict() compacts the window into one
+MAX_SEGMENTS = 32
+
+
+class BookingCache:
+    """
+    Local store holding a rolling window of fetched bookings as Parquet segments.
+
+    Every fetch appends one segment named after the createdDate range it covers
+    (`<first>_<last>_<n>.parquet`, UTC), so the high-water mark is the newest
+    segment's end, eviction drops whole segments and a read only opens the
+    segments overlapping its range. Rows stay in Arrow from the BigQuery result
+    to the pipeline's DataFrame. ':memory:' keeps the segments in the process.
+    """
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._memory = {} if path == ':memory:' else None
+        if self._memory is None:
+            os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def _locked(self, exclusive=True):
+        # Other processes (dashboard, scheduler) may share the directory
+        if self._memory is not None:
+            with self._lock:
+                yield
+            return
+        with self._lock, open(os.path.join(self.path, '.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _segments(self):
+        """
+        {name: (first, last)} of the stored segments, times as datetime64[us]
+        """
+        names = self._memory if self._memory is not None else [
+            name for name in os.listdir(self.path) if name.endswith('.parquet')
+        ]
+        segments = {}
+        for name in names:
+            first, last = name.split('_')[:2]
+            segments[name] = tuple(np.datetime64(datetime.strptime(value, SEGMENT_TIME_FORMAT), 'us') for value in (first, last))
+        return segments
+
+    def _read_segment(self, name):
+        if self._memory is not None:
+            return self._memory[name]
+        import pyarrow.parquet as pq
+
+        return pq.read_table(os.path.join(self.path, name), schema=_cache_schema())
+
+    def _write_segment(self, table):
+        import pyarrow.compute as pc
+
+        first, last = pc.min_max(table.column('createdDate')).values()
+        name = f"{first.as_py():{SEGMENT_TIME_FORMAT}}_{last.as_py():{SEGMENT_TIME_FORMAT}}_{time.time_ns()}.parquet"
+        if self._memory is not None:
+            self._memory[name] = table
+            return name
+        import pyarrow.parquet as pq
+
+        tmp_path = os.path.join(self.path, f'.{name}.{os.getpid()}.tmp')
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, name))
+        return name
+
+    def _read_range(self, start, end):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        tables = [self._read_segment(name) for name, (first, last) in sorted(self._segments().items())
+                  if last >= start and first <= end]
+        table = pa.concat_tables(tables) if tables else _cache_schema().empty_table()
+        created = table.column('createdDate')
+        return table.filter(pc.and_(pc.greater_equal(created, pa.scalar(start, created.type)),
+                                    pc.less_equal(created, pa.scalar(end, created.type))))
+
+    def high_water_mark(self):
+        with self._locked(exclusive=False):
+            segments = self._segments()
+        if not segments:
+            return None
+        return pd.Timestamp(max(last for _, last in segments.values())).strftime(TIME_FORMAT)
+
+    def append(self, table):
+        """
+        Store fetched rows (an Arrow table) as a new segment, leaving out rows already cached.
+        Returns the number of rows stored.
+        """
+        table = _cache_table(table)
+        if table.num_rows == 0:
+            return 0
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        with self._locked():
+            segments = self._segments()
+            newest = max((last for _, last in segments.values()), default=None)
+            created = table.column('createdDate')
+            if newest is not None and pc.min(created).as_py() <= newest.astype(object):
+                # The fetch starts at the high-water mark, so only rows up to it can be cached already
+                overlap = pc.less_equal(created, pa.scalar(newest, created.type))
+                old = table.filter(overlap).to_pandas()
+                cached = self._read_range(old['createdDate'].min().to_datetime64(), newest).to_pandas()
+                seen = old.merge(cached[BOOKING_KEY].drop_duplicates(), on=BOOKING_KEY, how='left', indicator=True)['_merge'] == 'both'
+                table = pa.concat_tables([
+                    table.filter(pc.invert(overlap)),
+                    pa.Table.from_pandas(old[~seen.to_numpy()], schema=table.schema, preserve_index=False),
+                ])
+            if table.num_rows:
+                self._write_segment(table)
+        return table.num_rows
+
+    def _remove_segment(self, name):
+        if self._memory is not None:
+            return self._memory.pop(name).num_rows
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.path, name)
+        rows = pq.read_metadata(path).num_rows
+        os.remove(path)
+        return rows
+
+    def evict(self, before):
+        """
+        Drop segments holding only rows older than `before`, and compact the rest into one segment
+        once there are more than MAX_SEGMENTS. Returns the number of rows dropped.
+        """
+        before = np.datetime64(pd.Timestamp(before), 'us')
+        evicted = 0
+        with self._locked():
+            segments = self._segments()
+            for name, (_, last) in list(segments.items()):
+                if last < before:
+                    evicted += self._remove_segment(name)
+                    del segments[name]
+            if len(segments) > MAX_SEGMENTS:
+                kept = self._read_range(before, max(last for _, last in segments.values()))
+                self._write_segment(kept)
+                evicted += sum(self._remove_segment(name) for name in segments) - kept.num_rows
+        return evicted
+
+    def read(self, start_time, end_time):
+        """
+        Cached rows with createdDate in [start_time, end_time] as an Arrow table, oldest first.
+        Same-second bookings are in pickup order, the tie-break the hourly counts query uses.
+        """
+        import pyarrow.compute as pc
+
+        start = np.datetime64(pd.Timestamp(start_time), 'us')
+        end = np.datetime64(pd.Timestamp(end_time), 'us')
+        with self._locked(exclusive=False):
+            table = self._read_range(start, end)
+        order = pc.sort_indices(table, sort_keys=[('createdDate', 'ascending'), ('latitude', 'ascending'), ('longitude', 'ascending')])
+        return table.take(order)
+
+
+def fetch_bookings(client=None, now=None, window_hours=WINDOW_HOURS, cache=None):
+    """
+    Bookings of the last `window_hours`, pulling only rows newer than the cache's high-water mark.
+    `client` can be any object with BigQuery's query(sql).result() interface.
+    """
+    if client is None:
+        client = get_client()
+    if cache is None:
+        cache = BookingCache()
+
+    # ⏳ Calculate time range (UTC)
+    current_datetime = now or datetime.now()
+    current_datetime_utc = current_datetime - timedelta(hours=5, minutes=30)
+    window_start_utc = current_datetime_utc - timedelta(hours=window_hours)
+
+    start_time = window_start_utc.strftime(TIME_FORMAT)
+    end_time = current_datetime_utc.strftime(TIME_FORMAT)
+
+    high_water_mark = cache.high_water_mark()
+    fetch_from = max(start_time, high_water_mark) if high_water_mark else start_time
+
+    # 🚀 Execute query for the new rows only
+    try:
+        if fetch_from <= end_time:
+            results = client.query(build_query(fetch_from, end_time)).result()
+            new_rows = result_to_table(results)
+            inserted = cache.append(new_rows)
+            print(f"✅ Fetched {new_rows.num_rows} rows since {fetch_from} ({inserted} new).")
+    except Exception as e:
+        print(f"❌ An error occurred while fetching data: {e}")
+
+    evicted = cache.evict(start_time)
+    if evicted:
+        print(f"🧹 Evicted {evicted} bookings older than {start_time}.")
+
+    cursor_df = _arrow_to_frame(cache.read(start_time, end_time))
+    if cursor_df.empty:
         print("⚠️ No data found in the given time range.")
-        
-except Exception as e:
-    print(f"❌ An error occurred while fetching data: {e}")
\ No newline at end of file
+    return cursor_df
+
+
+def build_hourly_counts_query(start_time, end_time, zones, city_zone):
+    """
+    SQL doing the 10-minute customer dedupe, zone assignment and hourly counting in BigQuery.
+    `zones` are a city's geofences ({zone: {"lat", "lon", "radius_km"}}); hours are IST.
+    The city total counts every booking unless it is geofenced itself.
+    """
+    city_rows = '' if city_zone in zones else f"SELECT '{city_zone}' AS zone, created_at FROM deduped\n    UNION ALL\n    "
+    zone_rows = ",\n        ".join(
+        f"STRUCT('{name}' AS zone, ST_GEOGPOINT({z['lon']}, {z['lat']}) AS center, {float(z['radius_km']) * 1000} AS radius_m)"
+        for name, z in zones.items()
+    )
+    return f"""
+WITH bookings AS (
+    SELECT
+        TIMESTAMP(createdDate) AS created_at,
+        customerNumber,
+        pickupGeoLocation AS geo
+    FROM {TABLE}
+    WHERE createdDate >= '{start_time}'
+      AND createdDate <= '{end_time}'
+),
+deduped AS (
+    SELECT created_at, geo
+    FROM bookings
+    WHERE created_at IS NOT NULL
+    QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY customerNumber, DIV(UNIX_SECONDS(created_at), 600)
+        ORDER BY created_at, ST_Y(geo), ST_X(geo)
+    ) = 1
+),
+zones AS (
+    SELECT * FROM UNNEST([
+        {zone_rows}
+    ])
+),
+tagged AS (
+    {city_rows}SELECT z.zone, d.created_at
+    FROM deduped AS d
+    JOIN zones AS z ON ST_DWITHIN(d.geo, z.center, z.radius_m)
+)
+SELECT
+    zone,
+    DATETIME_TRUNC(DATETIME(created_at, 'Asia/Kolkata'), HOUR) AS ds,
+    COUNT(*) AS y
+FROM tagged
+GROUP BY zone, ds
+"""
+
+
+def fetch_hourly_counts(client=None, now=None, window_hours=WINDOW_HOURS, zones=None, city_zone=None,
+                        calendar=None, city=None):
+    """
+    Server-side aggregation mode: only the zone x hour count table leaves BigQuery.
+    Returns the same dense (hour x zone) matrix as dataprocess.hourly_zone_counts,
+    laid on `calendar` when one is given. `zones` and `city_zone` default to those
+    of the catalog city `city`.
+    """
+    from geofence import load_zone_config
+    from zone_catalog import get_zone_catalog
+    from dataprocess import densify_hours
+
+    if client is None:
+        client = get_client()
+    if zones is None:
+        zones = load_zone_config(city)
+    if city_zone is None:
+        city_zone = get_zone_catalog().city(city).city_zone
+
+    current_datetime = now or datetime.now()
+    current_datetime_utc = current_datetime - timedelta(hours=5, minutes=30)
+    start_time = (current_datetime_utc - timedelta(hours=window_hours)).strftime(TIME_FORMAT)
+    end_time = current_datetime_utc.strftime(TIME_FORMAT)
+
+    columns = [city_zone] + [zone for zone in zones if zone != city_zone]
+    try:
+        results = client.query(build_hourly_counts_query(start_time, end_time, zones, city_zone)).result()
+        if hasattr(results, 'to_arrow'):
+            long_counts = results.to_arrow(create_bqstorage_client=False).to_pandas()
+        else:
+            long_counts = pd.DataFrame([dict(row) for row in results], columns=['zone', 'ds', 'y'])
+        print(f"✅ Fetched {len(long_counts)} hourly zone counts.")
+    except Exception as e:
+        print(f"❌ An error occurred while fetching hourly counts: {e}")
+        long_counts = pd.DataFrame(columns=['zone', 'ds', 'y'])
+
+    long_counts['ds'] = pd.to_datetime(long_counts['ds'])
+    counts = long_counts.pivot_table(index='ds', columns='zone', values='y', aggfunc='sum', fill_value=0)
+    return densify_hours(counts, columns, calendar).astype('int64')
+
+
+def compare_hourly_counts(server_counts, python_counts):
+    """
+    Cell-by-cell difference between the server-side and Python aggregations (empty when they agree)
+    """
+    index = server_counts.index.union(python_counts.index)
+    columns = server_counts.columns.union(python_counts.columns)
+    server = server_counts.reindex(index=index, columns=columns, fill_value=0)
+    python = python_counts.reindex(index=index, columns=columns, fill_value=0)
+    diff = (server - python).stack()
+    return diff[diff != 0]
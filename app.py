@@ -1,5 +1,8 @@
 import streamlit as st
-from model_predict import *
+from snapshot_store import snapshot_store
+from timeslots import hour_slot
+from zone_catalog import get_zone_catalog
+import os
 import sys
 import traceback
 from datetime import datetime, timedelta
@@ -16,8 +19,130 @@ def get_prediction_time():
     
     return current_time, prediction_time
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_predictions(zones, slot, city):
+    """
+    Predictions for a city's zone set and IST hour slot, shared by every session.
+    The slot changes when the hour rolls over, which starts a fresh pipeline run.
+    """
+    # Pulls in pandas, BigQuery and the model stack, so only imported when a run is really needed
+    from pipeline import run_pipeline
+
+    predicted_values = run_pipeline(city=city).predicted_values
+    return {zone: float(value) for zone, value in predicted_values.items() if zone in zones}
+
+def load_predictions(current_time, city=None):
+    """
+    Precomputed snapshot of a city (the catalog's default when None) for the current hour
+    if the scheduler wrote one, else a live (cached) run
+    """
+    city = get_zone_catalog().city(city)
+    snapshot = snapshot_store.read(hour_slot(current_time), city.key)
+    if snapshot is not None:
+        return snapshot['predictions']
+
+    return get_predictions(tuple(city.model_zones), hour_slot(current_time).isoformat(), city.key)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_forecast(slot, city):
+    """
+    Live multi-hour forecast of a city for an IST hour slot, used when the snapshot has none
+    """
+    from pipeline import run_forecast
+    from forecast import forecast_to_dict
+
+    return forecast_to_dict(run_forecast(city=city))
+
+def load_forecast(current_time, city=None):
+    """
+    {'hours': [...], 'zones': {zone: [...]}} for a city's next hours, from the snapshot when available
+    """
+    city = get_zone_catalog().city(city).key
+    snapshot = snapshot_store.read(hour_slot(current_time), city)
+    if snapshot is not None and 'forecast' in snapshot:
+        return snapshot['forecast']
+    return get_forecast(hour_slot(current_time).isoformat(), city)
+
+def render_forecast_chart(forecast, zone_display_names, city_zone):
+    import pandas as pd
+
+    hours = pd.to_datetime(forecast['hours'])
+    chart = pd.DataFrame(
+        {zone_display_names.get(zone, zone): values for zone, values in forecast['zones'].items() if zone != city_zone},
+        index=hours.strftime('%I %p'),
+    )
+    city = pd.Series(forecast['zones'].get(city_zone, []), index=hours.strftime('%I %p'), name=zone_display_names.get(city_zone, city_zone))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Zones**")
+        st.line_chart(chart)
+    with col2:
+        st.markdown("**Total city**")
+        st.line_chart(city)
+
+def load_diagnostics(current_time, city=None):
+    """
+    Stage records of the run behind a city's current predictions: the snapshot's, else this process's latest run
+    """
+    snapshot = snapshot_store.read(hour_slot(current_time), city)
+    if snapshot is not None and 'diagnostics' in snapshot:
+        return snapshot['diagnostics']
+
+    from instrumentation import instrumentation
+    return instrumentation.latest_run()
+
+def render_diagnostics(diagnostics):
+    if not diagnostics or not diagnostics.get('stages'):
+        st.caption("No stage records for this hour yet.")
+        return
+
+    stages = diagnostics['stages']
+    total = sum(record['wall_s'] for record in stages if record['stage'] != 'model_load')
+    st.caption(f"Run started {diagnostics.get('started_at', '?')} for slot {diagnostics.get('slot', '?')} · {total:.2f}s across stages")
+    st.dataframe(
+        [
+            {
+                'stage': record['stage'] + (f" ({record['zone']})" if record.get('zone') else ''),
+                'wall (s)': round(record['wall_s'], 3),
+                'rows in': record.get('rows_in'),
+                'rows out': record.get('rows_out'),
+                'peak RSS (MB)': record.get('peak_rss_mb'),
+                'cached': '✅' if record.get('cached') else '',
+                'status': f"❌ {record.get('error', '')}" if record.get('status') == 'error' else '',
+            }
+            for record in stages
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """
+    Serve /metrics from the Streamlit process when SNAPE_METRICS_PORT is set
+    """
+    from instrumentation import start_metrics_server
+    return start_metrics_server()
+
 def main():
-    st.title("🚖 Kolkata Taxi Demand Prediction Dashboard")
+    if os.environ.get('SNAPE_METRICS_PORT'):
+        start_metrics_endpoint()
+
+
+    catalog = get_zone_catalog()
+    city = catalog.city()
+    if len(catalog.cities) > 1:
+        # One process serves every city of the catalog
+        keys = list(catalog.cities)
+        key = st.sidebar.selectbox("City", keys, index=keys.index(city.key),
+                                   format_func=lambda key: catalog.cities[key].display_name)
+        city = catalog.city(key)
+    city_zone = city.city_zone
+    # Zone name mapping for better display
+    zone_display_names = city.display_names()
+
+    st.title(f"🚖 {city.display_name} Taxi Demand Prediction Dashboard")
     
     # Get time information
     current_time, prediction_time = get_prediction_time()
@@ -39,25 +164,24 @@ def main():
     
     try:
         with st.spinner("🔄 Loading data and running predictions..."):
-            # Import after Streamlit setup to ensure proper initialization
-            from model_predict import predicted_values
+            predicted_values = load_predictions(current_time, city.key)
             
         st.success("✅ Predictions completed successfully!")
         
-        # Separate the 5 zones from total city demand
-        zone_predictions = {k: v for k, v in predicted_values.items() if k != 'kolkata_city'}
-        total_city_demand = predicted_values.get('kolkata_city', 0)
+        # Separate the zones from total city demand
+        zone_predictions = {k: v for k, v in predicted_values.items() if k != city_zone}
+        total_city_demand = predicted_values.get(city_zone, 0)
         
         # Display total city demand prominently
-        st.markdown("### 🏙️ Total Kolkata City Demand")
+        st.markdown(f"### 🏙️ Total {city.display_name} City Demand")
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             st.markdown(
                 f"""
                 <div style="text-align: center; padding: 25px; background-color: #e8f4fd; border-radius: 15px; border: 2px solid #1f77b4;">
                     <h2 style="color: #1f77b4; margin: 0;">{int(max(0, total_city_demand))} Rides</h2>
-                    <p style="font-size: 18px; color: #2c3e50; margin: 10px 0;">Expected in next hour across all Kolkata</p>
-                    <small style="color: #7f8c8d;">This includes all 5 zones + other areas</small>
+                    <p style="font-size: 18px; color: #2c3e50; margin: 10px 0;">Expected in next hour across all {city.display_name}</p>
+                    <small style="color: #7f8c8d;">This includes all {len(zone_predictions)} zones + other areas</small>
                 </div>
                 """, 
                 unsafe_allow_html=True
@@ -67,20 +191,11 @@ def main():
         
         # Display zone-wise predictions
         st.markdown("### 📊 Zone-wise Demand Breakdown")
-        st.markdown(f"*Demand forecast for {prediction_time.strftime('%I:%M %p')} across 5 key zones*")
+        st.markdown(f"*Demand forecast for {prediction_time.strftime('%I:%M %p')} across {len(zone_predictions)} key zones*")
         
-        # Create responsive columns for the 5 zones
+        # Create responsive columns for the zones
         cols = st.columns(3)  # 3 columns for better layout
         
-        # Zone name mapping for better display
-        zone_display_names = {
-            'airport': '🛫 Airport Area',
-            'laketown': '🏘️ Lake Town',
-            'sectorV': '🏢 Sector V',
-            'victoria': '🏛️ Victoria Memorial',
-            'howrah': '🚂 Howrah Station'
-        }
-        
         for i, (region, value) in enumerate(zone_predictions.items()):
             col_index = i % len(cols)
             with cols[col_index]:
@@ -108,6 +223,16 @@ def main():
                     delta_color=delta_color
                 )
         
+        # Multi-hour outlook for dispatch planning
+        st.markdown("---")
+        st.markdown("### 🔮 Demand Outlook")
+        try:
+            forecast = load_forecast(current_time, city.key)
+            st.markdown(f"*Hourly demand forecast for the next {len(forecast['hours'])} hours*")
+            render_forecast_chart(forecast, zone_display_names, city_zone)
+        except Exception as e:
+            st.warning(f"⚠️ Demand outlook unavailable: {e}")
+
         # Zone-based insights and recommendations
         st.markdown("---")
         col1, col2 = st.columns(2)
@@ -135,7 +260,7 @@ def main():
         with col2:
             st.markdown("### 🎯 Driver Deployment Recommendations")
             
-            # Find high and low demand zones among the 5 zones only
+            # Find high and low demand zones among the zones only
             high_demand_zones = [zone for zone, demand in zone_predictions.items() if demand >= 20]
             medium_demand_zones = [zone for zone, demand in zone_predictions.items() if 10 <= demand < 20]
             low_demand_zones = [zone for zone, demand in zone_predictions.items() if demand < 10]
@@ -192,10 +317,13 @@ def main():
                     delta=f"{int(peak_zone[1])} rides"
                 )
         
+        with st.expander("🛠️ Pipeline diagnostics"):
+            render_diagnostics(load_diagnostics(current_time, city.key))
+
         # Show last updated time
         st.markdown("---")
         st.caption(f"🕒 Last updated: {current_time.strftime('%I:%M:%S %p IST')} | Next update in: {60 - current_time.minute} minutes")
-        st.caption("📍 **Note:** Total city demand includes the 5 tracked zones plus other areas across Kolkata")
+        st.caption(f"📍 **Note:** Total city demand includes the {len(zone_predictions)} tracked zones plus other areas across {city.display_name}")
         
     except Exception as e:
         st.error(f"❌ An error occurred: {str(e)}")
@@ -0,0 +1,240 @@
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from Script_fetch_from_db import COLUMNS, TIME_FORMAT, _arrow_to_frame, _typed_frame, get_client, iter_booking_frames
+from Parse import parse_bookings
+from process import assign_zones
+from dataprocess import hourly_zone_counts
+from laggeddata import LAGS, build_lag_panel
+from weatherunion_script import FEATURE_COLUMNS, FALLBACK_WEATHER
+from geofence import get_zone_index
+from zone_catalog import get_zone_catalog
+from reconcile import METHODS, RECONCILE_METHOD
+
+# Bookings are loaded this many hours at a time, which bounds memory on long ranges
+CHUNK_HOURS = 7 * 24
+
+# Offset subtracted from naive IST times to get the UTC times bookings are stored in
+IST_OFFSET = timedelta(hours=5, minutes=30)
+
+
+def parquet_source(path):
+    """
+    Booking loader over a local Parquet file or directory: (start_utc, end_utc) -> typed DataFrame.
+    Only the row groups overlapping the requested range are read.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format='parquet')
+    created = dataset.schema.field('createdDate').type
+    columns = [name for name in COLUMNS if name in dataset.schema.names]
+
+    def load(start, end):
+        if pa.types.is_timestamp(created):
+            low, high = pa.scalar(start, type=created), pa.scalar(end, type=created)
+        else:
+            # Text timestamps in TIME_FORMAT compare correctly as strings
+            low, high = start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT)
+        table = dataset.to_table(columns=columns, filter=(ds.field('createdDate') >= low) & (ds.field('createdDate') < high))
+        return _arrow_to_frame(table)
+
+    return load
+
+
+def bigquery_source(client=None):
+    """
+    Booking loader over BigQuery, streaming each range as Arrow record batches
+    """
+    client = client or get_client()
+
+    def load(start, end):
+        # build_query's upper bound is inclusive
+        last = (end - timedelta(seconds=1)).strftime(TIME_FORMAT)
+        frames = list(iter_booking_frames(client, start.strftime(TIME_FORMAT), last))
+        return pd.concat(frames, ignore_index=True) if frames else _typed_frame(pd.DataFrame(columns=COLUMNS))
+
+    return load
+
+
+def iter_hourly_counts(load, start, end, chunk_hours=CHUNK_HOURS, city=None):
+    """
+    Stream a city's (hour x zone) count matrix for IST hours in [start, end), one chunk of bookings at a time.
+    Chunks are aligned on IST hours, so no hour is split between two chunks.
+    """
+    zone_index = get_zone_index(city)
+    city_zone = get_zone_catalog().city(city).city_zone
+    columns = [city_zone] + [zone for zone in zone_index.zone_names if zone != city_zone]
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(hours=chunk_hours), end)
+        bookings = load(chunk_start - IST_OFFSET, chunk_end - IST_OFFSET)
+
+        hours = pd.date_range(chunk_start, chunk_end, freq='h', inclusive='left', name='ds')
+        if len(bookings):
+            counts = hourly_zone_counts(assign_zones(parse_bookings(bookings), zone_index), zone_index.zone_names,
+                                        city_zone, calendar=hours)
+        else:
+            counts = pd.DataFrame(0, index=hours, columns=columns)
+        print(f"📦 {chunk_start:%Y-%m-%d %H:00} → {chunk_end:%Y-%m-%d %H:00}: {len(bookings)} bookings")
+        yield counts, len(bookings)
+        chunk_start = chunk_end
+
+
+class ErrorAccumulator:
+    """
+    Running per-zone MAE / MAPE sums, so metrics never need every hour in memory.
+    MAPE skips hours whose actual demand is 0.
+    """
+    def __init__(self, zones):
+        self.zones = list(zones)
+        self.hours = 0
+        self.abs_error = {}
+        self.pct_error = {}
+        self.pct_hours = {}
+
+    def add(self, actual, **predictions):
+        """
+        Score one chunk: `actual` and each named prediction are (hour x zone) frames
+        """
+        actual = actual[self.zones].to_numpy(dtype=float)
+        nonzero = actual > 0
+        self.hours += len(actual)
+        for name, predicted in predictions.items():
+            error = np.abs(predicted[self.zones].to_numpy(dtype=float) - actual)
+            pct = np.divide(error, actual, out=np.zeros_like(actual), where=nonzero)
+            self.abs_error[name] = self.abs_error.get(name, 0) + error.sum(axis=0)
+            self.pct_error[name] = self.pct_error.get(name, 0) + pct.sum(axis=0)
+            self.pct_hours[name] = self.pct_hours.get(name, 0) + nonzero.sum(axis=0)
+
+    def report(self):
+        report = {}
+        for z, zone in enumerate(self.zones):
+            report[zone] = {'hours': int(self.hours)}
+            for name in self.abs_error:
+                report[zone][f'mae_{name}'] = float(self.abs_error[name][z] / max(1, self.hours))
+                pct_hours = self.pct_hours[name][z]
+                report[zone][f'mape_{name}'] = float(100 * self.pct_error[name][z] / pct_hours) if pct_hours else None
+        return report
+
+
+def feature_rows(panel, weather, positions, zones):
+    """
+    (n, FEATURE_COLUMNS) raw input rows for each model zone at the given hour positions
+    """
+    rows_by_zone = []
+    for column in zones:
+        rows = np.empty((len(positions), len(FEATURE_COLUMNS)))
+        for i, feature in enumerate(FEATURE_COLUMNS):
+            source = panel[feature][column] if feature in panel else weather[feature]
+            rows[:, i] = source.to_numpy(dtype=float)[positions]
+        rows_by_zone.append(rows)
+    return rows_by_zone
+
+
+def backtest(count_chunks, zones=None, weather=None, predict=None, lags=LAGS, method=RECONCILE_METHOD, city=None):
+    """
+    Predict every hour from the hours before it and score against what actually happened.
+
+    `count_chunks` yields consecutive (hour x column) count matrices. The last
+    max(lags) + 1 hours are carried into the next chunk, so lags and next-hour
+    targets cross chunk boundaries, while only one chunk is held at a time.
+    Returns the per-zone report for raw and corrected (reconciled with `method`) predictions.
+    """
+    import model_predict
+
+    city_zone = get_zone_catalog().city(city).city_zone
+    zones = list(zones or get_zone_catalog().city(city).model_zones)
+    predict = predict or model_predict.predict_zone_rows
+    errors = ErrorAccumulator(zones)
+    carry_hours = max(lags) + 1
+
+    carry = None
+    for counts in count_chunks:
+        history = counts if carry is None else pd.concat([carry, counts])
+        panel = build_lag_panel(history, lags)
+
+        # Hours with a full lag history and a known next hour. The carried hours were
+        # scored in the previous chunk up to its second to last one, which sits at max(lags) here.
+        positions = np.arange(max(lags), len(history) - 1)
+        carry = history.iloc[-carry_hours:]
+        if not len(positions):
+            continue
+
+        hourly_weather = pd.DataFrame(FALLBACK_WEATHER, index=history.index)
+        if weather is not None:
+            hourly_weather.update(weather)
+
+        predicted = predict(zones, feature_rows(panel, hourly_weather, positions, zones))
+        targets = history.index[positions + 1]
+        raw = pd.DataFrame(np.column_stack(predicted), index=targets, columns=zones)
+        actual = pd.DataFrame(history.iloc[positions + 1][zones].to_numpy(), index=targets, columns=zones)
+
+        errors.add(actual, raw=raw, corrected=model_predict.correct_zone_matrix(raw, city_zone, method))
+
+    return errors.report()
+
+
+def load_weather(path):
+    """
+    Optional hourly weather history: a CSV or Parquet file with an IST `ds` column and weather columns
+    """
+    weather = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+    weather['ds'] = pd.to_datetime(weather['ds'])
+    return weather.set_index('ds')[[c for c in FALLBACK_WEATHER if c in weather.columns]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the zone models over a range of IST dates")
+    parser.add_argument('--start', required=True, help="first IST date (YYYY-MM-DD)")
+    parser.add_argument('--end', required=True, help="IST date after the last one (YYYY-MM-DD)")
+    parser.add_argument('--parquet', help="local Parquet snapshot of bookings (default: BigQuery)")
+    parser.add_argument('--weather', help="hourly weather history (CSV/Parquet); fallback weather otherwise")
+    parser.add_argument('--chunk-hours', type=int, default=CHUNK_HOURS)
+    parser.add_argument('--city', help="city of the zone catalog (default: its default city)")
+    parser.add_argument('--reconcile', choices=METHODS, default=RECONCILE_METHOD, help="zone/city reconciliation method")
+    parser.add_argument('--output', help="write the report as JSON")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d')
+    end = datetime.strptime(args.end, '%Y-%m-%d')
+    # Load the lag history before `start` too, so its first hour is already scored
+    history_start = start - timedelta(hours=max(LAGS))
+    load = parquet_source(args.parquet) if args.parquet else bigquery_source()
+    weather = load_weather(args.weather) if args.weather else None
+
+    began = time.perf_counter()
+    n_bookings = 0
+
+    def chunks():
+        nonlocal n_bookings
+        for counts, n in iter_hourly_counts(load, history_start, end, args.chunk_hours, args.city):
+            n_bookings += n
+            yield counts
+
+    report = backtest(chunks(), weather=weather, method=args.reconcile, city=args.city)
+    elapsed = time.perf_counter() - began
+
+    print(f"\n📊 BACKTEST {args.start} → {args.end} ({n_bookings} bookings, {elapsed:.1f}s, {args.reconcile} reconciliation)")
+    print("=" * 78)
+    print(f"{'zone':15s} {'hours':>6s} {'MAE raw':>10s} {'MAE corr':>10s} {'MAPE raw':>10s} {'MAPE corr':>10s}")
+    for zone, row in report.items():
+        mape = lambda v: f"{v:9.1f}%" if v is not None else f"{'-':>10s}"
+        print(f"{zone:15s} {row['hours']:6d} {row['mae_raw']:10.2f} {row['mae_corrected']:10.2f} "
+              f"{mape(row['mape_raw'])} {mape(row['mape_corrected'])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'start': args.start, 'end': args.end, 'bookings': n_bookings,
+                       'seconds': round(elapsed, 2), 'reconcile': args.reconcile, 'zones': report}, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
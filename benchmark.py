@@ -0,0 +1,366 @@
+import os
+import re
+import gc
+import sys
+import json
+import time
+import ctypes
+import argparse
+import tempfile
+import platform
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+SIZES = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+
+# Fixed run time so every run sees the same synthetic window
+NOW = datetime(2025, 6, 1, 14, 20)
+
+# A stage counts as a regression when it is this much slower than the baseline
+REGRESSION_RATIO = 1.2
+
+# Most the booking-sized stages (parse, geofence, aggregate) may add to RSS per million bookings
+MEMORY_BUDGET_MB_PER_MILLION = 160
+
+# Below this many bookings RSS noise swamps the per-million figure; it is reported, not enforced
+MEMORY_MIN_ROWS = 1_000_000
+
+
+def synthetic_bookings(n_rows, now=NOW, hours=25, seed=0):
+    """
+    bookings_rides-shaped rows for the `hours` before `now` (IST), in the UTC the table stores.
+
+    Most pickups scatter around the zone centers, the rest across the city, and
+    about 5% are repeat bookings by the same customer a few minutes apart, so the
+    Parse dedupe has work to do.
+    """
+    from geofence import load_zone_config
+
+    rng = np.random.default_rng(seed)
+    zones = load_zone_config()
+    centers = np.array([[zone['lat'], zone['lon']] for zone in zones.values()])
+
+    end_utc = np.datetime64(now - timedelta(hours=5, minutes=30), 's')
+    created = end_utc - rng.integers(0, hours * 3600, n_rows).astype('timedelta64[s]')
+    customers = rng.integers(0, max(1, n_rows // 4), n_rows)
+
+    near_zone = rng.random(n_rows) < 0.7
+    center = centers[rng.integers(0, len(centers), n_rows)]
+    lat = np.where(near_zone, center[:, 0] + rng.normal(0, 0.02, n_rows), rng.uniform(22.45, 22.70, n_rows))
+    lon = np.where(near_zone, center[:, 1] + rng.normal(0, 0.02, n_rows), rng.uniform(88.25, 88.50, n_rows))
+
+    repeats = rng.random(n_rows) < 0.05
+    source = rng.integers(0, n_rows, n_rows)
+    customers[repeats] = customers[source[repeats]]
+    created[repeats] = created[source[repeats]] + rng.integers(0, 300, repeats.sum()).astype('timedelta64[s]')
+
+    order = np.argsort(created)[::-1]
+    return pd.DataFrame({
+        'createdDate': pd.to_datetime(created[order]),
+        'latitude': lat[order],
+        'longitude': lon[order],
+        'bookingDate': pd.to_datetime(created[order]),
+        'customerNumber': pd.Categorical(customers[order].astype(str)),
+    })
+
+
+# Zone literals and the city-wide row of Script_fetch_from_db.build_hourly_counts_query
+ZONE_LITERAL = re.compile(r"STRUCT\('(\w+)' AS zone, ST_GEOGPOINT\(([-0-9.e]+), ([-0-9.e]+)\) AS center, ([0-9.e]+) AS radius_m\)")
+CITY_ROW = re.compile(r"SELECT '(\w+)' AS zone, created_at FROM deduped")
+DEDUPE_SECONDS = re.compile(r"DIV\(UNIX_SECONDS\(created_at\), (\d+)\)")
+
+# Sphere radius BigQuery geography functions use
+BIGQUERY_EARTH_RADIUS_M = 6371008.8
+
+
+def evaluate_hourly_counts(bookings, sql):
+    """
+    What BigQuery returns for an hourly counts query over `bookings` (already cut to its time bounds):
+    the dedupe window, zones, radii and city row are read back from the SQL, then deduped, tagged with
+    ST_DWITHIN (<= on the sphere) and counted per IST hour as the query does
+    """
+    import pyarrow as pa
+
+    created = pd.to_datetime(bookings['createdDate'], format='ISO8601')
+    window_s = int(DEDUPE_SECONDS.search(sql).group(1))
+    deduped = pd.DataFrame({
+        'created_at': created,
+        'customer': bookings['customerNumber'],
+        'window': created.to_numpy(dtype='datetime64[s]').astype(np.int64) // window_s,
+        'lat': bookings['latitude'].to_numpy(dtype=np.float64),
+        'lon': bookings['longitude'].to_numpy(dtype=np.float64),
+    })[created.notna().to_numpy()]
+    deduped = deduped.sort_values(['created_at', 'lat', 'lon'], kind='stable').drop_duplicates(['customer', 'window'])
+
+    tagged = [(name, deduped['created_at']) for name in CITY_ROW.findall(sql)]
+    lat, lon = np.radians(deduped['lat'].to_numpy()), np.radians(deduped['lon'].to_numpy())
+    for name, center_lon, center_lat, radius_m in ZONE_LITERAL.findall(sql):
+        center_lat, center_lon = np.radians(float(center_lat)), np.radians(float(center_lon))
+        d = (np.sin((lat - center_lat) / 2) ** 2
+             + np.cos(lat) * np.cos(center_lat) * np.sin((lon - center_lon) / 2) ** 2)
+        inside = 2 * BIGQUERY_EARTH_RADIUS_M * np.arcsin(np.sqrt(d)) <= float(radius_m)
+        tagged.append((name, deduped['created_at'][inside]))
+
+    long_counts = pd.concat(
+        [pd.DataFrame({'zone': name, 'ds': (times + pd.Timedelta(hours=5, minutes=30)).dt.floor('h')}) for name, times in tagged],
+        ignore_index=True,
+    ).groupby(['zone', 'ds']).size().rename('y').reset_index()
+    return pa.Table.from_pandas(long_counts, preserve_index=False)
+
+
+class FakeQueryJob:
+    def __init__(self, table):
+        self.table = table
+
+    def result(self):
+        return self
+
+    def to_arrow(self, create_bqstorage_client=False):
+        return self.table
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        return iter(self.table.to_batches(max_chunksize=100_000))
+
+
+class FakeBigQueryClient:
+    """
+    Serves a DataFrame through BigQuery's query(sql).result().to_arrow() interface,
+    filtered on the createdDate bounds in the SQL. Hourly counts queries are
+    answered by evaluate_hourly_counts.
+    """
+    def __init__(self, bookings):
+        import pyarrow as pa
+
+        self.bookings = bookings
+        self.table = pa.Table.from_pandas(bookings, preserve_index=False)
+
+    def query(self, sql):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        start, end = re.findall(r"createdDate [<>]= '([0-9: -]+)'", sql)[:2]
+        created = self.table.column('createdDate')
+        if pa.types.is_timestamp(created.type):
+            start, end = pd.Timestamp(start).to_datetime64(), pd.Timestamp(end).to_datetime64()
+        # Text timestamps compare as strings, as they do in BigQuery
+        mask = pc.and_(pc.greater_equal(created, start), pc.less_equal(created, end))
+        rows = self.table.filter(mask)
+        if 'ST_DWITHIN' in sql:
+            return FakeQueryJob(evaluate_hourly_counts(rows.to_pandas(), sql))
+        return FakeQueryJob(rows)
+
+
+def client_as_of(bookings, now):
+    """
+    Fake BigQuery holding only the bookings created up to `now` (IST), as the table would at that time
+    """
+    cutoff = np.datetime64(now - timedelta(hours=5, minutes=30))
+    return FakeBigQueryClient(bookings[bookings['createdDate'].to_numpy() <= cutoff].reset_index(drop=True))
+
+
+def fake_weather():
+    """
+    Point the weather module at constant in-process readings instead of OpenWeatherMap
+    """
+    import weatherunion_script
+
+    reading = {'temperature': 29.0, 'rain_intensity': 0.0, 'rain_accumulation': 0.0}
+    weatherunion_script.fetch_weather_data = lambda lat, lon, name: dict(reading)
+    weatherunion_script.fetch_weather_forecast = lambda lat, lon, name: [(0, dict(reading))]
+    weatherunion_script.weather_cache.clear()
+
+
+@contextmanager
+def temporary_lag_store():
+    """
+    Point the lag stage at a ring buffer in a temporary directory, so a benchmark never writes the real one
+    """
+    import lag_store
+
+    saved = lag_store.LAG_STORE_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        lag_store.LAG_STORE_PATH = os.path.join(tmp, 'lag_store.npy')
+        try:
+            yield lag_store.LAG_STORE_PATH
+        finally:
+            lag_store.LAG_STORE_PATH = saved
+
+
+def time_stage(func, repeat):
+    """
+    Best and median wall time of `repeat` calls; returns (seconds dict, last output)
+    """
+    times = []
+    output = None
+    for _ in range(repeat):
+        output = None
+        gc.collect()
+        start = time.perf_counter()
+        output = func()
+        times.append(time.perf_counter() - start)
+    return {'best_s': min(times), 'median_s': float(np.median(times)), 'repeat': repeat}, output
+
+
+def benchmark_size(n_rows, repeat=3):
+    """
+    Time every stage on its own for one synthetic data size.
+    Each stage's input is the previous stage's output, prepared outside the timed call.
+    """
+    from Script_fetch_from_db import BookingCache, fetch_bookings
+    import pipeline
+
+    fake_weather()
+    bookings = synthetic_bookings(n_rows)
+    client = FakeBigQueryClient(bookings)
+    results = {}
+
+    def record(name, func, rows_in):
+        stats, output = time_stage(func, repeat)
+        stats.update(rows_in=int(rows_in), rows_out=int(len(output)))
+        results[name] = stats
+        print(f"⏱️ {name:10s} {stats['best_s']:9.4f}s  ({rows_in} → {len(output)} rows)")
+        return output
+
+    record('fetch', lambda: fetch_bookings(client, NOW, cache=BookingCache(':memory:')), n_rows)
+
+    parsed = record('parse', lambda: pipeline.parse_stage(bookings, NOW), n_rows)
+    del bookings, client
+    tagged = record('geofence', lambda: pipeline.geofence_stage(parsed, NOW), len(parsed))
+    del parsed
+    counts = record('aggregate', lambda: pipeline.aggregate_stage(tagged, NOW), len(tagged))
+    del tagged
+    with temporary_lag_store():
+        features = record('lags', lambda: pipeline.lag_stage(counts, NOW), len(counts))
+    features = record('weather', lambda: pipeline.weather_stage(features, NOW), len(features))
+    features = record('validate', lambda: pipeline.validate_stage(features, NOW), len(features))
+
+    import model_predict
+    zones = pipeline.get_city().model_zones
+    model_predict.predict_demand_batch(features, zones)  # model loading is not part of the timing
+    record('predict', lambda: model_predict.predict_demand_batch(features, zones), len(features))
+    return results
+
+
+def release_free_memory():
+    """
+    Hand freed heap pages back to the OS (glibc only), so RSS growth afterwards is new allocation
+    """
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def memory_size(n_rows, budget=MEMORY_BUDGET_MB_PER_MILLION):
+    """
+    Peak RSS added by parse -> geofence -> aggregate on `n_rows` synthetic bookings.
+    The input frame is built first and not counted.
+    """
+    from instrumentation import PeakMemorySampler
+    import pipeline
+
+    bookings = synthetic_bookings(n_rows)
+    gc.collect()
+    release_free_memory()
+    with PeakMemorySampler(interval=0.001) as memory:
+        parsed = pipeline.parse_stage(bookings, NOW)
+        tagged = pipeline.geofence_stage(parsed, NOW)
+        pipeline.aggregate_stage(tagged, NOW)
+        del parsed, tagged
+
+    peak_mb = (memory.peak_bytes - memory.start_bytes) / 2**20
+    per_million = peak_mb * 1_000_000 / n_rows
+    enforced = n_rows >= MEMORY_MIN_ROWS
+    ok = per_million <= budget or not enforced
+    print(f"{'✅' if ok else '❌'} peak +{peak_mb:.1f} MB = {per_million:.1f} MB per million bookings"
+          f" (budget {budget} MB{'' if enforced else ', not enforced'})")
+    return {'peak_mb': round(peak_mb, 1), 'mb_per_million': round(per_million, 1), 'budget_mb_per_million': budget, 'ok': ok}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, ratio=REGRESSION_RATIO):
+    """
+    Print per-stage slowdowns against a baseline results file; returns the regressed (size, stage) pairs
+    """
+    regressions = []
+    for size, stages in results['sizes'].items():
+        for stage, stats in stages.items():
+            old = baseline.get('sizes', {}).get(size, {}).get(stage, {})
+            if 'best_s' not in stats or 'best_s' not in old:
+                continue
+            change = stats['best_s'] / max(old['best_s'], 1e-9)
+            flag = '❌' if change > ratio else '✅'
+            print(f"{flag} {size:4s} {stage:10s} {old['best_s']:9.4f}s → {stats['best_s']:9.4f}s ({change:.2f}x)")
+            if change > ratio:
+                regressions.append((size, stage))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic bookings")
+    parser.add_argument('--sizes', nargs='+', default=list(SIZES), choices=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="results JSON (default: benchmarks/<commit>.json)")
+    parser.add_argument('--compare', help="baseline results JSON; exit 1 on a regression")
+    parser.add_argument('--memory', action='store_true',
+                        help=f"measure peak RSS instead of time; exit 1 above {MEMORY_BUDGET_MB_PER_MILLION} MB per million bookings")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'sizes': {},
+    }
+    if args.memory:
+        results['memory'] = {}
+        for size in args.sizes:
+            print(f"\n🧠 {size} bookings")
+            results['memory'][size] = memory_size(SIZES[size])
+            gc.collect()
+        output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'local'}-memory.json")
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {output}")
+        return 0 if all(r['ok'] for r in results['memory'].values()) else 1
+
+    for size in args.sizes:
+        print(f"\n📊 {size} bookings")
+        # The 10M run is slow enough that one repetition is representative
+        repeat = 1 if SIZES[size] >= 10_000_000 else args.repeat
+        results['sizes'][size] = benchmark_size(SIZES[size], repeat)
+        gc.collect()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print(f"❌ {len(regressions)} stage(s) more than {REGRESSION_RATIO:.1f}x slower than the baseline")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
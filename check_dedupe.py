@@ -0,0 +1,82 @@
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Rows per random case, and random cases checked
+ROWS = 2000
+SEEDS = 5
+
+
+def legacy_dedupe(dataset):
+    """
+    The original sort-based rule: first booking per (customer, 10-minute window) after sorting by time
+    """
+    from Parse import parse_created_dates
+
+    dataset = dataset.copy()
+    dataset['date_column'] = parse_created_dates(dataset['createdDate'])
+    dataset['10min_window'] = dataset['date_column'].dt.floor('10min')
+    return dataset.sort_values(['customerNumber', 'date_column'], kind='stable').drop_duplicates(['customerNumber', '10min_window'], keep='first')
+
+
+def random_bookings(n_rows, null_share=0.1, seed=0):
+    """
+    Bookings with repeat customers, null customerNumbers and unparseable dates
+    """
+    from Parse import DATE_FORMATS
+
+    rng = np.random.default_rng(seed)
+    created = pd.Timestamp('2025-06-01') + pd.to_timedelta(rng.integers(0, 3 * 3600, n_rows), unit='s')
+    customers = rng.integers(0, max(1, n_rows // 10), n_rows).astype(str).astype(object)
+    customers[rng.random(n_rows) < null_share] = None
+    text = created.strftime(DATE_FORMATS[0]).to_numpy(dtype=object)
+    text[rng.random(n_rows) < 0.01] = 'not a date'
+    return pd.DataFrame({
+        'createdDate': text,
+        'latitude': rng.uniform(22.45, 22.70, n_rows),
+        'longitude': rng.uniform(88.25, 88.50, n_rows),
+        'customerNumber': customers,
+    })
+
+
+def check(n_rows=ROWS, seeds=SEEDS):
+    """
+    Parse.dedupe_mask against the original sort-based dedupe; returns True when every case matches
+    """
+    from Parse import customer_categories, dedupe_mask, parse_created_dates
+
+    cases = {'null customer between two others': pd.DataFrame({
+        'createdDate': ['2025-06-01 10:00:00', '2025-06-01 10:05:00', '2025-06-01 10:01:00'],
+        'latitude': [22.5, 22.5, 22.5],
+        'longitude': [88.4, 88.4, 88.4],
+        'customerNumber': ['0', '1', None],
+    })}
+    for seed in range(seeds):
+        cases[f'seed {seed}, {n_rows} rows, 10% null customers'] = random_bookings(n_rows, seed=seed)
+        categorical = random_bookings(n_rows, seed=seed)
+        categorical['customerNumber'] = categorical['customerNumber'].astype('category')
+        cases[f'seed {seed}, categorical customers'] = categorical
+
+    ok = True
+    for name, dataset in cases.items():
+        expected = legacy_dedupe(dataset).index.sort_values()
+        keep = dedupe_mask(parse_created_dates(dataset['createdDate']), customer_categories(dataset['customerNumber']))
+        kept = pd.Index(np.flatnonzero(keep))
+        same = kept.equals(expected)
+        ok &= same
+        print(f"{'✅' if same else '❌'} {name}: kept {len(kept)} rows (old dedupe {len(expected)})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the booking dedupe against the original rule")
+    parser.add_argument('--rows', type=int, default=ROWS)
+    parser.add_argument('--seeds', type=int, default=SEEDS)
+    args = parser.parse_args()
+    return 0 if check(args.rows, args.seeds) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
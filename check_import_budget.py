@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+from snapshot_store import SnapshotStore
+from timeslots import hour_slot, ist_now
+from zone_catalog import get_zone_catalog
+
+# Modules the read-only dashboard path must never import
+FORBIDDEN = ['tensorflow', 'keras', 'google.cloud.bigquery', 'sklearn']
+
+# Import app and serve the current hour from a snapshot, as a dashboard viewer would
+READ_PATH = "import app; from timeslots import ist_now; app.load_predictions(ist_now())"
+
+
+def parse_importtime(stderr):
+    """
+    {module: (cumulative microseconds, nesting depth)} from `python -X importtime` output
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(cumulative_us), depth)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if the dashboard read path imports heavy modules")
+    parser.add_argument('--max-ms', type=float, default=None, help="optional budget for the total import time")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        # A snapshot for the current slot, so the read path never falls back to a live run
+        city = get_zone_catalog().city()
+        SnapshotStore(snapshot_dir).write(hour_slot(ist_now()), {city.city_zone: 0.0}, city=city.key)
+        env = dict(os.environ, SNAPE_SNAPSHOT_DIR=snapshot_dir)
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', READ_PATH],
+            cwd=root, env=env, capture_output=True, text=True,
+        )
+
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        print("❌ Dashboard read path failed to run")
+        return 1
+
+    modules = parse_importtime(result.stderr)
+    top_level = {name: us for name, (us, depth) in modules.items() if depth == 0}
+    total_ms = sum(top_level.values()) / 1000
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:10]
+    print(json.dumps({'total_ms': round(total_ms, 1), 'slowest_ms': {k: round(v / 1000, 1) for k, v in slowest}}, indent=2))
+
+    failed = False
+    imported = [name for name in FORBIDDEN if any(m == name or m.startswith(name + '.') for m in modules)]
+    if imported:
+        print(f"❌ Read-only dashboard path imports {', '.join(imported)}")
+        failed = True
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"❌ Import time {total_ms:.0f} ms exceeds budget of {args.max_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("✅ Import budget check passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
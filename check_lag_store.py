@@ -0,0 +1,83 @@
+import os
+import sys
+import argparse
+import tempfile
+from datetime import timedelta
+
+import numpy as np
+
+# Scheduled runs fed through the ring buffer before the checked slot (two per hour)
+RUNS = 20
+
+# Largest difference in predicted rides treated as equal
+TOLERANCE = 1e-6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the lag ring buffer against lags rebuilt from counts after hourly scheduled runs")
+    parser.add_argument('--rows', type=int, default=100_000, help="synthetic bookings over the whole period")
+    parser.add_argument('--runs', type=int, default=RUNS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Everything the runs write goes to the temporary directory
+        os.environ.update(
+            SNAPE_BOOKING_CACHE=os.path.join(tmp, 'bookings'),
+            SNAPE_LAG_STORE=os.path.join(tmp, 'lag_store.npy'),
+            SNAPE_SNAPSHOT_DIR=os.path.join(tmp, 'snapshots'),
+            SNAPE_FETCH_MODE='rows',
+        )
+        import Script_fetch_from_db
+        import pipeline
+        from benchmark import NOW, client_as_of, fake_weather, synthetic_bookings
+        from laggeddata import build_lag_features
+        from scheduler import PredictionScheduler
+        from snapshot_store import SnapshotStore
+        from timeslots import hour_slot
+
+        slot = hour_slot(NOW)
+        live_at = NOW
+        bookings = synthetic_bookings(args.rows, now=live_at, hours=args.runs + 48)
+        fake_weather()
+
+        # The daemon's schedule: each hour's precompute at :55, then its refresh after the hour turns
+        scheduler = PredictionScheduler(SnapshotStore(os.environ['SNAPE_SNAPSHOT_DIR']))
+        run_at, run_slot = scheduler.next_run(slot - timedelta(hours=args.runs // 2))
+        for _ in range(args.runs):
+            client = client_as_of(bookings, run_at)
+            Script_fetch_from_db.get_client = lambda: client
+            scheduler.run_once(run_slot, run_at)
+            run_at, run_slot = scheduler.next_run(run_at)
+
+        client = client_as_of(bookings, live_at)
+        Script_fetch_from_db.get_client = lambda: client
+        run = pipeline.run_pipeline(live_at, refresh=True)
+        zones = pipeline.get_city().model_zones
+        stored = run.outputs['lags']
+        rebuilt = build_lag_features(run.outputs['aggregate'].reindex(columns=zones, fill_value=0))
+        rebuilt.index = list(zones)
+
+        forecast = pipeline.run_forecast(live_at, run=run)
+        first_hour = forecast.iloc[0]
+
+    problems = []
+    for column in rebuilt.columns:
+        differs = ~np.isclose(stored[column].to_numpy(dtype=float), rebuilt[column].to_numpy(dtype=float), equal_nan=True)
+        for zone in rebuilt.index[differs]:
+            problems.append(f"{zone} {column}: store {stored.at[zone, column]:.0f} vs counts {rebuilt.at[zone, column]:.0f}")
+    for zone, value in run.predicted_values.items():
+        if abs(value - first_hour[zone]) > TOLERANCE:
+            problems.append(f"{zone}: next-hour card {value:.3f} vs outlook's first hour {first_hour[zone]:.3f}")
+
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        print(f"❌ Lag store disagrees with the counts after {args.runs} scheduled runs")
+        return 1
+    print(f"✅ Lag store matches lags rebuilt from counts for slot {slot:%H:00} after {args.runs} scheduled runs,"
+          f" and the outlook starts at the next-hour predictions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# City total column of the random forecasts
+CITY = 'city'
+
+# Hours and zones of the property checks, and random cases checked
+CHECK_HOURS = 10_000
+CHECK_ZONES = 5
+SEEDS = 5
+
+
+def random_forecasts(hours, n_zones, seed=0):
+    """
+    Non-negative (hours x zones + city) forecasts, city last, covering the awkward cases:
+    zones far above the city, a city of 0, all zeros and one zone dominating the rest
+    """
+    rng = np.random.default_rng(seed)
+    zones = rng.gamma(2.0, 50.0, (hours, n_zones)) * rng.uniform(0, 3, (hours, 1))
+    city = zones.sum(axis=1) * rng.uniform(0.2, 2.0, hours)
+    city[::7] = 0.0
+    zones[::11] = 0.0
+    zones[::13, 0] *= 1000
+    return np.column_stack([zones, city])
+
+
+def legacy_correction(row):
+    """
+    The original per-hour dict rule, the reference for the capped method
+    """
+    from reconcile import ZONE_SHARE
+
+    city_total = row[CITY]
+    zone_sum = sum(v for k, v in row.items() if k != CITY)
+    if zone_sum <= city_total:
+        return row
+    factor = city_total * ZONE_SHARE / zone_sum
+    return {k: (v if k == CITY else v * factor) for k, v in row.items()}
+
+
+def check(hours=CHECK_HOURS, n_zones=CHECK_ZONES, seeds=SEEDS):
+    """
+    Property checks on random forecasts; returns True when every one passes
+    """
+    from reconcile import METHODS, ZONE_SHARE, check_coherent, reconcile
+    from model_predict import correct_zone_matrix
+
+    ok = True
+    for seed in range(seeds):
+        matrix = random_forecasts(hours, n_zones, seed)
+        zones, city = matrix[:, :-1], matrix[:, -1]
+        weights = np.random.default_rng(seed).uniform(0.1, 10, n_zones + 1)
+        for method in METHODS:
+            for kwargs in ([{}, {'weights': weights}] if method == 'ols' else [{}]):
+                out = reconcile(matrix, method, **kwargs)
+                failures = []
+                if not check_coherent(out):
+                    failures.append('zones exceed the city')
+                already = zones.sum(axis=1) <= ZONE_SHARE * city
+                if not np.allclose(out[already], matrix[already]):
+                    failures.append('changed hours that needed no reconciliation')
+                if not np.allclose(reconcile(out, method, **kwargs), out):
+                    failures.append('not idempotent')
+                if method in ('capped', 'proportional') and not np.array_equal(out[:, -1], city):
+                    failures.append('city total changed')
+                if method == 'bottom_up' and not np.array_equal(out[:, :-1], zones):
+                    failures.append('zones changed')
+                name = method + (' (weighted)' if kwargs else '')
+                ok &= not failures
+                print(f"{'❌' if failures else '✅'} seed {seed} {name:20s} {', '.join(failures) or 'coherent'}")
+
+    # The matrix path matches the original per-hour rule
+    matrix = random_forecasts(200, n_zones)
+    frame = pd.DataFrame(matrix, columns=[f'zone_{i}' for i in range(n_zones)] + [CITY])
+    expected = np.array([list(legacy_correction(row).values()) for row in frame.to_dict('records')])
+    same = np.allclose(correct_zone_matrix(frame, CITY, method='capped').to_numpy(), expected)
+    ok &= same
+    print(f"{'✅' if same else '❌'} capped matches the per-hour correction")
+    return ok
+
+
+def bench(hours=8760, n_zones=50, repeat=5):
+    """
+    Time every method on a year of hours, against reconciling the hours one at a time
+    """
+    from reconcile import METHODS, reconcile
+
+    matrix = random_forecasts(hours, n_zones)
+    columns = [f'zone_{i}' for i in range(n_zones)] + [CITY]
+    rows = [dict(zip(columns, row)) for row in matrix]
+
+    start = time.perf_counter()
+    for row in rows:
+        legacy_correction(row)
+    loop_s = time.perf_counter() - start
+    print(f"⏱️ {'per-hour loop':20s} {loop_s:9.4f}s  ({hours} hours x {n_zones} zones)")
+
+    for method in METHODS:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            reconcile(matrix, method)
+            times.append(time.perf_counter() - start)
+        print(f"⏱️ {method:20s} {min(times):9.4f}s  ({loop_s / min(times):.0f}x faster)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or benchmark the zone/city reconciliation methods")
+    parser.add_argument('--bench', action='store_true', help="time the methods instead of checking them")
+    parser.add_argument('--hours', type=int, default=8760, help="hours of the benchmark matrix")
+    parser.add_argument('--zones', type=int, default=50, help="zones of the benchmark matrix")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.hours, args.zones)
+        return 0
+    return 0 if check() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
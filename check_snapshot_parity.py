@@ -0,0 +1,97 @@
+import os
+import sys
+import argparse
+import tempfile
+from datetime import timedelta
+
+# Slot checked; the scheduler precomputes it at :55 of the hour before and refreshes it after the hour turns
+SLOT_HOUR = 15
+
+# How far past the refresh the synthetic bookings go
+BOOKINGS_AFTER_MINUTES = 30
+
+# Largest difference in predicted rides treated as equal
+TOLERANCE = 1e-6
+
+
+def compare(snapshot, live):
+    """
+    Differences between a snapshot and a live run's snapshot-shaped dict, as printable strings
+    """
+    problems = []
+    if snapshot['diagnostics']['slot'] != live['diagnostics']['slot']:
+        problems.append(f"diagnostics slot {snapshot['diagnostics']['slot']} vs {live['diagnostics']['slot']}")
+    if snapshot['forecast']['hours'] != live['forecast']['hours']:
+        problems.append(f"forecast hours start {snapshot['forecast']['hours'][0]} vs {live['forecast']['hours'][0]}")
+    for zone, value in snapshot['predictions'].items():
+        if abs(value - live['predictions'][zone]) > TOLERANCE:
+            problems.append(f"{zone}: snapshot {value:.3f} vs live {live['predictions'][zone]:.3f}")
+    for zone, values in snapshot['forecast']['zones'].items():
+        if any(abs(a - b) > TOLERANCE for a, b in zip(values, live['forecast']['zones'][zone])):
+            problems.append(f"{zone}: forecast differs")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that a precomputed snapshot matches a live run of the same slot")
+    parser.add_argument('--rows', type=int, default=20_000, help="synthetic bookings over the 25 hours before the checked time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Everything the runs write goes to the temporary directory
+        os.environ.update(
+            SNAPE_BOOKING_CACHE=os.path.join(tmp, 'bookings'),
+            SNAPE_LAG_STORE=os.path.join(tmp, 'lag_store.npy'),
+            SNAPE_SNAPSHOT_DIR=os.path.join(tmp, 'snapshots'),
+            SNAPE_FETCH_MODE='rows',
+        )
+        import Script_fetch_from_db
+        import pipeline
+        from benchmark import NOW, client_as_of, fake_weather, synthetic_bookings
+        from forecast import forecast_to_dict
+        from scheduler import PredictionScheduler
+        from snapshot_store import SnapshotStore
+
+        scheduler = PredictionScheduler(SnapshotStore(os.environ['SNAPE_SNAPSHOT_DIR']))
+        slot = NOW.replace(hour=SLOT_HOUR, minute=0)
+        precompute_at = slot - timedelta(hours=1) + timedelta(minutes=scheduler.minute)
+        refresh_at = slot + timedelta(minutes=scheduler.refresh_minute)
+        # Bookings keep arriving after the precompute, through the refresh and past it
+        bookings = synthetic_bookings(args.rows, now=refresh_at + timedelta(minutes=BOOKINGS_AFTER_MINUTES))
+        fake_weather()
+
+        client = client_as_of(bookings, precompute_at)
+        Script_fetch_from_db.get_client = lambda: client
+        provisional = scheduler.run_once(slot, precompute_at)
+
+        # The dashboard's view at the refresh: BigQuery has the slot's first minutes of bookings
+        client = client_as_of(bookings, refresh_at)
+        snapshot = scheduler.ensure_current(refresh_at)
+
+        run = pipeline.run_pipeline(refresh_at, refresh=True)
+        live = {
+            'predictions': {zone: float(value) for zone, value in run.predicted_values.items()},
+            'forecast': forecast_to_dict(pipeline.run_forecast(refresh_at, run=run)),
+            'diagnostics': run.diagnostics,
+        }
+        current = run.outputs['validate']['y']
+
+    problems = compare(snapshot, live)
+    if not provisional['provisional']:
+        problems.append(f"snapshot computed at {precompute_at:%H:%M} is not marked provisional")
+    if snapshot['provisional'] or snapshot['version'] <= provisional['version']:
+        problems.append(f"provisional snapshot was not replaced at {refresh_at:%H:%M}")
+    if not (current > 0).all():
+        problems.append(f"current-hour demand y is empty for {list(current.index[current <= 0])}")
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        print(f"❌ Snapshot for slot {slot:%H:00} disagrees with a live run at {refresh_at:%H:%M}")
+        return 1
+    print(f"✅ Snapshot for slot {slot:%H:00} precomputed at {precompute_at:%H:%M} and refreshed at {refresh_at:%H:%M}"
+          f" matches a live run (y from {int(current.min())} to {int(current.max())}, forecast from {snapshot['forecast']['hours'][0]})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,83 +1,70 @@
-from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from process import *
 
-########## Overall############
-dataset['date'] = dataset['date_column'].dt.date
-dataset['hour'] = dataset['date_column'].dt.hour
-hourly_demand = dataset.groupby(['date', 'hour']).size().reset_index(name='y')
-hourly_demand['ds'] = hourly_demand.apply(lambda row: datetime.combine(row['date'], datetime.min.time()) + timedelta(hours=row['hour']), axis=1)
-hourly_demand = hourly_demand.drop(columns=['date', 'hour'])
-hourly_demand['ds'] = pd.to_datetime(hourly_demand['ds'])
+from laggeddata import LAGS
+from geofence import in_zone
+from zone_catalog import get_zone_catalog
 
-all_hours = pd.date_range(start=hourly_demand['ds'].min(), end=hourly_demand['ds'].max(), freq='H')
-hourly_demand = hourly_demand.set_index('ds').reindex(all_hours, fill_value=0).reset_index()
-hourly_demand = hourly_demand.rename(columns={'index': 'ds'})
-hourly_demand = hourly_demand.set_index('ds')
+HOUR_NS = 3_600_000_000_000
 
-############ Airport #########
-dataset_airport['date'] = dataset_airport['date_column'].dt.date
-dataset_airport['hour'] = dataset_airport['date_column'].dt.hour
-hourly_demand_airpot = dataset_airport.groupby(['date', 'hour']).size().reset_index(name='y')
-hourly_demand_airpot['ds'] = hourly_demand_airpot.apply(lambda row: datetime.combine(row['date'], datetime.min.time()) + timedelta(hours=row['hour']), axis=1)
-hourly_demand_airpot = hourly_demand_airpot.drop(columns=['date', 'hour'])
-hourly_demand_airpot['ds'] = pd.to_datetime(hourly_demand_airpot['ds'])
+# Hours in the shared calendar: the current hour plus enough history for the largest lag
+CALENDAR_HOURS = max(LAGS) + 1
 
-all_hours = pd.date_range(start=hourly_demand_airpot['ds'].min(), end=hourly_demand_airpot['ds'].max(), freq='H')
-hourly_demand_airpot = hourly_demand_airpot.set_index('ds').reindex(all_hours, fill_value=0).reset_index()
-hourly_demand_airpot = hourly_demand_airpot.rename(columns={'index': 'ds'})
-hourly_demand_airpot = hourly_demand_airpot.set_index('ds')
+def hour_calendar(now, hours=CALENDAR_HOURS):
+    """
+    The `hours` IST hours ending with the one `now` falls in. Every zone's counts are laid
+    on this index, so the last row is always the current hour and lag_n is always n rows up.
+    """
+    return pd.date_range(end=pd.Timestamp(now).floor('h'), periods=hours, freq='h', name='ds')
 
-########### Rabindrasadan ##########
-dataset_rabindrasadan['date'] = dataset_rabindrasadan['date_column'].dt.date
-dataset_rabindrasadan['hour'] = dataset_rabindrasadan['date_column'].dt.hour
-hourly_demand_rabindrasadan = dataset_rabindrasadan.groupby(['date', 'hour']).size().reset_index(name='y')
-hourly_demand_rabindrasadan['ds'] = hourly_demand_rabindrasadan.apply(lambda row: datetime.combine(row['date'], datetime.min.time()) + timedelta(hours=row['hour']), axis=1)
-hourly_demand_rabindrasadan = hourly_demand_rabindrasadan.drop(columns=['date', 'hour'])
-hourly_demand_rabindrasadan['ds'] = pd.to_datetime(hourly_demand_rabindrasadan['ds'])
+def hourly_zone_counts(dataset, zone_names, city_zone=None, calendar=None):
+    """
+    Count bookings per zone and hour straight from the `zone_mask` bitmask (bit k = zone_names[k]).
+    Returns a dense (hour x zone) matrix indexed by `ds`, with the city total as `city_zone`,
+    over the hourly `calendar` when one is given, else from the first to the last booking's hour.
+    The city total (`city_zone`, the catalog's default city's when None) counts every booking,
+    unless it is itself one of the geofenced zones.
+    """
+    if city_zone is None:
+        city_zone = get_zone_catalog().city().city_zone
+    bits = {zone: k for k, zone in enumerate(zone_names)}
+    columns = [city_zone] + [zone for zone in zone_names if zone != city_zone]
+    hours = dataset['date_column'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    valid = hours != np.iinfo(np.int64).min
+    hours = hours[valid] // HOUR_NS
+    mask = dataset['zone_mask'].to_numpy()[valid]
 
-all_hours = pd.date_range(start=hourly_demand_rabindrasadan['ds'].min(), end=hourly_demand_rabindrasadan['ds'].max(), freq='H')
-hourly_demand_rabindrasadan = hourly_demand_rabindrasadan.set_index('ds').reindex(all_hours, fill_value=0).reset_index()
-hourly_demand_rabindrasadan = hourly_demand_rabindrasadan.rename(columns={'index': 'ds'})
-hourly_demand_rabindrasadan = hourly_demand_rabindrasadan.set_index('ds')
+    # Hour positions relative to the calendar (or the first booking), then one bincount per zone
+    first = hours.min() if len(hours) else 0
+    if calendar is not None and len(calendar):
+        first = calendar[0].value // HOUR_NS
+    positions = hours - first
+    n_hours = len(calendar) if calendar is not None else int(positions.max()) + 1 if len(positions) else 0
+    inside = (positions >= 0) & (positions < n_hours)
+    positions, mask = positions[inside], mask[inside]
 
-############## Howrah #########
-dataset_howrah['date'] = dataset_howrah['date_column'].dt.date
-dataset_howrah['hour'] = dataset_howrah['date_column'].dt.hour
-hourly_demand_howrah = dataset_howrah.groupby(['date', 'hour']).size().reset_index(name='y')
-hourly_demand_howrah['ds'] = hourly_demand_howrah.apply(lambda row: datetime.combine(row['date'], datetime.min.time()) + timedelta(hours=row['hour']), axis=1)
-hourly_demand_howrah = hourly_demand_howrah.drop(columns=['date', 'hour'])
-hourly_demand_howrah['ds'] = pd.to_datetime(hourly_demand_howrah['ds'])
+    matrix = np.empty((n_hours, len(columns)), dtype=np.int64)
+    for c, zone in enumerate(columns):
+        selected = positions[in_zone(mask, bits[zone])] if zone in bits else positions
+        matrix[:, c] = np.bincount(selected, minlength=n_hours)
 
-all_hours = pd.date_range(start=hourly_demand_howrah['ds'].min(), end=hourly_demand_howrah['ds'].max(), freq='H')
-hourly_demand_howrah = hourly_demand_howrah.set_index('ds').reindex(all_hours, fill_value=0).reset_index()
-hourly_demand_howrah = hourly_demand_howrah.rename(columns={'index': 'ds'})
-hourly_demand_howrah = hourly_demand_howrah.set_index('ds')
+    index = calendar if calendar is not None else pd.DatetimeIndex((first + np.arange(n_hours)) * HOUR_NS, name='ds')
+    counts = pd.DataFrame(matrix, index=index, columns=columns)
 
-########## laketown ###########
-dataset_laketown['date'] = dataset_laketown['date_column'].dt.date
-dataset_laketown['hour'] = dataset_laketown['date_column'].dt.hour
-hourly_demand_laketown = dataset_laketown.groupby(['date', 'hour']).size().reset_index(name='y')
-hourly_demand_laketown['ds'] = hourly_demand_laketown.apply(lambda row: datetime.combine(row['date'], datetime.min.time()) + timedelta(hours=row['hour']), axis=1)
-hourly_demand_laketown = hourly_demand_laketown.drop(columns=['date', 'hour'])
-hourly_demand_laketown['ds'] = pd.to_datetime(hourly_demand_laketown['ds'])
+    print("data processed")
+    return counts
 
-all_hours = pd.date_range(start=hourly_demand_laketown['ds'].min(), end=hourly_demand_laketown['ds'].max(), freq='H')
-hourly_demand_laketown = hourly_demand_laketown.set_index('ds').reindex(all_hours, fill_value=0).reset_index()
-hourly_demand_laketown = hourly_demand_laketown.rename(columns={'index': 'ds'})
-hourly_demand_laketown = hourly_demand_laketown.set_index('ds')
+def densify_hours(counts, columns, calendar=None):
+    """
+    Reindex an (hour x zone) count matrix onto the given zone columns and onto `calendar`
+    (see hour_calendar), or every hour of its own range when no calendar is given
+    """
+    counts = counts.reindex(columns=columns, fill_value=0)
+    counts.columns.name = None
+    if calendar is not None:
+        return counts.reindex(calendar, fill_value=0)
+    if counts.empty:
+        return counts
 
-########### Sector V ###########
-dataset_sectorV['date'] = dataset_sectorV['date_column'].dt.date
-dataset_sectorV['hour'] = dataset_sectorV['date_column'].dt.hour
-hourly_demand_sectorV = dataset_sectorV.groupby(['date', 'hour']).size().reset_index(name='y')
-hourly_demand_sectorV['ds'] = hourly_demand_sectorV.apply(lambda row: datetime.combine(row['date'], datetime.min.time()) + timedelta(hours=row['hour']), axis=1)
-hourly_demand_sectorV = hourly_demand_sectorV.drop(columns=['date', 'hour'])
-hourly_demand_sectorV['ds'] = pd.to_datetime(hourly_demand_sectorV['ds'])
-
-all_hours = pd.date_range(start=hourly_demand_sectorV['ds'].min(), end=hourly_demand_sectorV['ds'].max(), freq='H')
-hourly_demand_sectorV = hourly_demand_sectorV.set_index('ds').reindex(all_hours, fill_value=0).reset_index()
-hourly_demand_sectorV = hourly_demand_sectorV.rename(columns={'index': 'ds'})
-hourly_demand_sectorV = hourly_demand_sectorV.set_index('ds')
-
-print("data processed")
\ No newline at end of file
+    all_hours = pd.date_range(start=counts.index.min(), end=counts.index.max(), freq='h', name='ds')
+    return counts.reindex(all_hours, fill_value=0)
@@ -1,10 +1,11 @@
-from weatherunion_script import *
+from pipeline import run_pipeline, get_city
+from weatherunion_script import FEATURE_COLUMNS
 import joblib
 import os
 from tensorflow.keras.models import load_model
 
 # Function to predict demand for a given zone
-def predict_demand_for_zone(zone, hourly_demand):
+def predict_demand_for_zone(zone, features):
     # Get the directory where this script is located
     script_dir = os.path.dirname(os.path.abspath(__file__))
     
@@ -31,8 +32,8 @@ def predict_demand_for_zone(zone, hourly_demand):
         print(f"Error loading model or scalers for zone {zone}: {e}")
         raise
     
-    # Extract hourly demand for the given zone
-    hourly_demand_zone = hourly_demand[zone]
+    # Extract the feature row for the given zone
+    hourly_demand_zone = features.loc[[zone], FEATURE_COLUMNS]
     print(f"Hourly demand for {zone}: {hourly_demand_zone}")
     print(f"Hourly demand shape: {hourly_demand_zone.shape}")
     print(f"Hourly demand values: {hourly_demand_zone.values}")
@@ -63,16 +64,10 @@ def predict_demand_for_zone(zone, hourly_demand):
 
 
 # Example usage:
-zones = ['airport', 'laketown', 'sectorV', 'victoria', 'howrah', 'kolkata_city']
+zones = get_city().model_zones
 
-hourly_demand = {
-    'airport': hourly_demand_airpot,
-    'laketown': hourly_demand_laketown,
-    'sectorV': hourly_demand_sectorV,
-    'victoria': hourly_demand_rabindrasadan,
-    'howrah': hourly_demand_howrah,
-    'kolkata_city': hourly_demand
-}
+# Feature rows per zone, as fed to the models
+hourly_demand = run_pipeline(until='weather').outputs['weather']
 
 # Dictionary to store results
 predicted_values = {}
@@ -0,0 +1,83 @@
+import calendar
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from laggeddata import LAGS
+from weatherunion_script import FEATURE_COLUMNS, FALLBACK_WEATHER, forecast_for_locations
+
+HORIZON_HOURS = 6
+
+WEATHER_COLUMNS = ['rain_intensity', 'rain_accumulation', 'temperature']
+
+# Offset subtracted from naive IST times to get UTC
+IST_OFFSET = timedelta(hours=5, minutes=30)
+
+
+def weather_matrix(zone_locations, start_hour, hours):
+    """
+    (hours, zones, WEATHER_COLUMNS) array: the weather each step's input row uses.
+    Step k predicts start_hour + k and sees the weather of the hour before it.
+    """
+    hours_utc = [calendar.timegm((start_hour + timedelta(hours=step) - IST_OFFSET).timetuple()) for step in range(hours)]
+    by_zone = forecast_for_locations(zone_locations, hours_utc)
+
+    weather = np.empty((hours, len(zone_locations), len(WEATHER_COLUMNS)))
+    for z, zone in enumerate(zone_locations):
+        for step, info in enumerate(by_zone.get(zone) or [FALLBACK_WEATHER] * hours):
+            weather[step, z] = [info.get(column, FALLBACK_WEATHER[column]) for column in WEATHER_COLUMNS]
+    return weather
+
+
+def recursive_forecast(counts, zone_locations, start_hour, hours=HORIZON_HOURS,
+                       predict=None, current_weather=None, lags=LAGS):
+    """
+    Roll every zone's model forward `hours` steps from an (hour x zone) count matrix.
+    `zone_locations` maps each zone (a count column) to its weather point.
+
+    Each step builds all zones' feature rows at once (y and lag_<n> read from the
+    history, as in laggeddata.build_lag_features), predicts them in one batched
+    call, and appends the predictions to the history for the next step.
+    Returns an (hour x zone) frame of raw predictions indexed by the predicted IST hour.
+    """
+    if predict is None:
+        from model_predict import predict_matrix as predict
+
+    zones = list(zone_locations)
+    history = counts.reindex(columns=zones, fill_value=0).to_numpy(dtype=float)
+    # Pad the front with NaN so short histories give NaN lags, like build_lag_features does
+    pad = max(lags) + 1 - len(history)
+    if pad > 0:
+        history = np.vstack([np.full((pad, len(zones)), np.nan), history])
+    history = np.vstack([history, np.empty((hours, len(zones)))])
+
+    weather = weather_matrix(zone_locations, start_hour, hours)
+    if current_weather is not None:
+        # The first step matches the single-hour prediction, which uses observed weather
+        weather[0] = current_weather.reindex(zones)[WEATHER_COLUMNS].to_numpy(dtype=float)
+
+    column_index = {column: i for i, column in enumerate(FEATURE_COLUMNS)}
+    rows = np.empty((len(zones), len(FEATURE_COLUMNS)))
+    end = len(history) - hours
+    for step in range(hours):
+        current = end + step - 1
+        rows[:, column_index['y']] = history[current]
+        for lag in lags:
+            rows[:, column_index[f'lag_{lag}']] = history[current - lag]
+        for i, column in enumerate(WEATHER_COLUMNS):
+            rows[:, column_index[column]] = weather[step, :, i]
+        history[current + 1] = predict(zones, rows)
+
+    index = pd.DatetimeIndex([start_hour + timedelta(hours=step + 1) for step in range(hours)], name='hour')
+    return pd.DataFrame(history[end:], index=index, columns=zones)
+
+
+def forecast_to_dict(forecast):
+    """
+    JSON-friendly form stored in snapshots: {'hours': [...], 'zones': {zone: [...]}}
+    """
+    return {
+        'hours': [hour.isoformat() for hour in forecast.index],
+        'zones': {zone: [float(v) for v in forecast[zone]] for zone in forecast.columns},
+    }
@@ -0,0 +1,155 @@
+import threading
+import numpy as np
+
+from zone_catalog import ZONE_CATALOG_PATH, get_zone_catalog
+
+# Mean earth radius (IUGG), the sphere BigQuery's geography functions use too
+EARTH_RADIUS_KM = 6371.0088
+
+# Degrees of latitude per km
+KM_TO_DEG = 1.0 / (EARTH_RADIUS_KM * np.pi / 180.0)
+
+# Rows per ZoneIndex.bitmask chunk
+BITMASK_CHUNK_SIZE = 65_536
+
+# Smallest unsigned type holding one bit per zone
+MASK_DTYPES = [(8, np.uint8), (16, np.uint16), (32, np.uint32), (64, np.uint64)]
+
+
+def mask_dtype(n_zones):
+    """
+    dtype of a zone bitmask column for `n_zones` zones
+    """
+    for bits, dtype in MASK_DTYPES:
+        if n_zones <= bits:
+            return np.dtype(dtype)
+    raise ValueError(f"A zone bitmask holds at most {MASK_DTYPES[-1][0]} zones, got {n_zones}")
+
+
+def in_zone(mask, k):
+    """
+    Boolean array, True for the rows whose bitmask has zone `k` set
+    """
+    mask = np.asarray(mask)
+    return (mask & mask.dtype.type(1 << k)) != 0
+
+
+def haversine_pairs(lats, lons, center_lats, center_lons):
+    """
+    Element-wise distance in km between points and their paired centers
+    """
+    lat = np.radians(lats)
+    center_lat = np.radians(center_lats)
+    d = (np.sin((lat - center_lat) * 0.5) ** 2
+         + np.cos(lat) * np.cos(center_lat) * np.sin(np.radians(lons - center_lons) * 0.5) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(d))
+
+
+def load_zone_config(city=None, path=ZONE_CATALOG_PATH):
+    """
+    A city's geofences from the zone catalog: {zone: {"lat": .., "lon": .., "radius_km": ..}}
+    """
+    return get_zone_catalog(path).city(city).geofences()
+
+
+class ZoneIndex:
+    """
+    Grid-bucket spatial index over circular zones.
+
+    The map is cut into square cells about as wide as the largest zone radius.
+    Every zone is registered in the cells its circle can touch, so a pickup
+    is only checked against the handful of zones in its own cell instead of
+    against every zone.
+    """
+    def __init__(self, zones):
+        self.zone_names = list(zones)
+        self.centers = np.array([[z['lat'], z['lon']] for z in zones.values()], dtype=np.float64)
+        self.radii = np.array([z['radius_km'] for z in zones.values()], dtype=np.float64)
+        self.cell_deg = max(self.radii.max(), 1e-3) * KM_TO_DEG if len(self.radii) else 1.0
+
+        cell_zones = {}
+        for k, ((lat, lon), radius) in enumerate(zip(self.centers, self.radii)):
+            # Bounding box of the circle, widened slightly to absorb rounding
+            dlat = radius * KM_TO_DEG * 1.01
+            dlon = dlat / max(np.cos(np.radians(abs(lat) + dlat)), 1e-6)
+            rows = range(self._row(lat - dlat), self._row(lat + dlat) + 1)
+            cols = range(self._col(lon - dlon), self._col(lon + dlon) + 1)
+            for row in rows:
+                for col in cols:
+                    cell_zones.setdefault(self._key(row, col), []).append(k)
+
+        # CSR layout: sorted cell keys, pointer array, flat zone ids
+        self.cell_keys = np.array(sorted(cell_zones), dtype=np.int64)
+        counts = [len(cell_zones[key]) for key in self.cell_keys]
+        self.cell_ptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.cell_zone_ids = np.array(
+            [k for key in self.cell_keys for k in cell_zones[key]], dtype=np.int64
+        )
+
+    def _row(self, lat):
+        return np.floor((np.asarray(lat) + 90.0) / self.cell_deg).astype(np.int64)
+
+    def _col(self, lon):
+        return np.floor((np.asarray(lon) + 180.0) / self.cell_deg).astype(np.int64)
+
+    @staticmethod
+    def _key(row, col):
+        return row * (1 << 32) + col
+
+    def query(self, lats, lons):
+        """
+        Every (point, zone) pair where the point lies inside the zone.
+        Returns two int64 arrays: point indices and zone indices.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if lats.size == 0 or self.cell_keys.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        keys = self._key(self._row(lats), self._col(lons))
+        pos = np.searchsorted(self.cell_keys, keys)
+        pos = np.minimum(pos, self.cell_keys.size - 1)
+        hit = self.cell_keys[pos] == keys
+
+        # Expand each point into its candidate zones
+        starts = np.where(hit, self.cell_ptr[pos], 0)
+        n_candidates = np.where(hit, self.cell_ptr[pos + 1] - self.cell_ptr[pos], 0)
+        point_idx = np.repeat(np.arange(lats.size, dtype=np.int64), n_candidates)
+        offsets = np.arange(point_idx.size, dtype=np.int64) - np.repeat(np.cumsum(n_candidates) - n_candidates, n_candidates)
+        zone_idx = self.cell_zone_ids[np.repeat(starts, n_candidates) + offsets]
+
+        dist = haversine_pairs(lats[point_idx], lons[point_idx], self.centers[zone_idx, 0], self.centers[zone_idx, 1])
+        inside = dist < self.radii[zone_idx]
+        return point_idx[inside], zone_idx[inside]
+
+    def bitmask(self, lats, lons):
+        """
+        One unsigned integer per point with bit k set when it lies inside zone k;
+        a byte per booking for up to 8 zones instead of one bool column per zone
+        """
+        dtype = mask_dtype(len(self.zone_names))
+        mask = np.zeros(np.asarray(lats).shape[0], dtype=dtype)
+        # query() holds several temporaries per candidate pair; chunking keeps them small
+        for start in range(0, mask.shape[0], BITMASK_CHUNK_SIZE):
+            stop = start + BITMASK_CHUNK_SIZE
+            point_idx, zone_idx = self.query(lats[start:stop], lons[start:stop])
+            np.bitwise_or.at(mask[start:stop], point_idx, np.left_shift(dtype.type(1), zone_idx.astype(dtype)))
+        return mask
+
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def get_zone_index(city=None, path=ZONE_CATALOG_PATH):
+    """
+    ZoneIndex over a city's zones, built once and reused until the catalog changes
+    """
+    catalog = get_zone_catalog(path)
+    key = (path, catalog.city(city).key)
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached is None or cached[0] is not catalog:
+            cached = (catalog, ZoneIndex(catalog.city(city).geofences()))
+            _index_cache[key] = cached
+        return cached[1]
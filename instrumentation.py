@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Local Prometheus endpoint, only started by processes that ask for it
+METRICS_HOST = os.environ.get('SNAPE_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('SNAPE_METRICS_PORT', 9108))
+
+# Set SNAPE_STRUCTURED_LOGS=0 to keep only the emoji prints
+STRUCTURED_LOGS = os.environ.get('SNAPE_STRUCTURED_LOGS', '1') != '0'
+
+# Seconds between RSS samples while a stage runs
+SAMPLE_INTERVAL = 0.01
+
+# Runs kept for the dashboard and the endpoint
+KEEP_RUNS = 20
+
+log = logging.getLogger('snape.stages')
+if not log.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+def rss_bytes():
+    """
+    Current resident set size; falls back to the process peak where /proc is unavailable
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def row_count(data):
+    """
+    Rows in a stage input/output: len() of frames and dicts, None for anything else
+    """
+    try:
+        return len(data)
+    except TypeError:
+        return None
+
+
+class PeakMemorySampler:
+    """
+    Samples RSS on a background thread while a block runs and keeps the highest reading
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, rss_bytes())
+
+    def __enter__(self):
+        self.start_bytes = self.peak_bytes = rss_bytes()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, rss_bytes())
+        return False
+
+
+class Instrumentation:
+    """
+    Records wall time, rows in/out, peak memory and outcome of every measured stage.
+
+    Each record is logged as one JSON line and folded into Prometheus-style
+    metrics; the last KEEP_RUNS runs are kept for the dashboard.
+    """
+    def __init__(self, keep_runs=KEEP_RUNS, structured_logs=STRUCTURED_LOGS):
+        self.structured_logs = structured_logs
+        self._runs = deque(maxlen=keep_runs)
+        self._durations = {}
+        self._errors = {}
+        self._last = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start_run(self, slot=None):
+        """
+        Begin a run; stages measured on this thread without an explicit run are added to it
+        """
+        run = {'slot': slot.isoformat() if slot else None, 'started_at': datetime.now().isoformat(timespec='seconds'), 'stages': []}
+        with self._lock:
+            self._runs.append(run)
+        self._local.run = run
+        return run
+
+    @contextmanager
+    def measure(self, stage, data=None, run=None, **labels):
+        """
+        Measure the enclosed block. Set `result['output']` to report rows out:
+
+            with instrumentation.measure('parse', bookings) as result:
+                result['output'] = parse_bookings(bookings)
+        """
+        result = {'output': None, 'cached': False}
+        error = None
+        start = time.perf_counter()
+        memory = PeakMemorySampler()
+        try:
+            with memory:
+                yield result
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # A stage that raises is recorded too, with the exception type
+            record = {
+                'stage': stage,
+                **labels,
+                'status': 'ok' if error is None else 'error',
+                'wall_s': round(time.perf_counter() - start, 6),
+                'rows_in': row_count(data),
+                'rows_out': row_count(result['output']),
+                'peak_rss_mb': round(memory.peak_bytes / 2**20, 1),
+                'rss_delta_mb': round((memory.peak_bytes - memory.start_bytes) / 2**20, 1),
+                'cached': result['cached'],
+            }
+            if error is not None:
+                record['error'] = type(error).__name__
+            self.record(record, run)
+
+    def record(self, record, run=None):
+        record = dict(record, ts=datetime.now().isoformat(timespec='milliseconds'))
+        run = run if run is not None else getattr(self._local, 'run', None)
+        with self._lock:
+            if run is not None:
+                run['stages'].append(record)
+            key = (record['stage'], record.get('zone', ''))
+            total, count = self._durations.get(key, (0.0, 0))
+            self._durations[key] = (total + record['wall_s'], count + 1)
+            if record.get('status') == 'error':
+                self._errors[key] = self._errors.get(key, 0) + 1
+            self._last[key] = record
+        if self.structured_logs:
+            log.info(json.dumps(record))
+
+    def latest_run(self):
+        with self._lock:
+            return self._runs[-1] if self._runs else None
+
+    def prometheus(self):
+        """
+        Metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            durations = dict(self._durations)
+            errors = dict(self._errors)
+            last = dict(self._last)
+            runs = len(self._runs)
+
+        def labels(key):
+            stage, zone = key
+            return f'stage="{stage}"' + (f',zone="{zone}"' if zone else '')
+
+        lines = [
+            '# HELP snape_stage_duration_seconds Wall time of pipeline stages',
+            '# TYPE snape_stage_duration_seconds summary',
+        ]
+        for key, (total, count) in sorted(durations.items()):
+            lines.append(f'snape_stage_duration_seconds_sum{{{labels(key)}}} {total:.6f}')
+            lines.append(f'snape_stage_duration_seconds_count{{{labels(key)}}} {count}')
+        lines += [
+            '# HELP snape_stage_errors_total Executions of pipeline stages that raised',
+            '# TYPE snape_stage_errors_total counter',
+        ]
+        for key in sorted(durations):
+            lines.append(f'snape_stage_errors_total{{{labels(key)}}} {errors.get(key, 0)}')
+        gauges = [
+            ('snape_stage_last_duration_seconds', 'wall_s', 'Wall time of the most recent execution'),
+            ('snape_stage_rows_in', 'rows_in', 'Rows passed into the most recent execution'),
+            ('snape_stage_rows_out', 'rows_out', 'Rows returned by the most recent execution'),
+            ('snape_stage_peak_rss_bytes', 'peak_rss_mb', 'Peak process RSS during the most recent execution'),
+        ]
+        for name, field, help_text in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            for key, record in sorted(last.items()):
+                value = record.get(field)
+                if value is None:
+                    continue
+                if field == 'peak_rss_mb':
+                    value = int(value * 2**20)
+                lines.append(f'{name}{{{labels(key)}}} {value}')
+        lines += [
+            '# HELP snape_process_rss_bytes Current process RSS',
+            '# TYPE snape_process_rss_bytes gauge',
+            f'snape_process_rss_bytes {rss_bytes()}',
+            '# HELP snape_pipeline_runs_recorded Pipeline runs kept in memory',
+            '# TYPE snape_pipeline_runs_recorded gauge',
+            f'snape_pipeline_runs_recorded {runs}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by the pipeline, the model registry and the metrics endpoint
+instrumentation = Instrumentation()
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serve /metrics on a daemon thread (once per process); returns the server
+    """
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = instrumentation.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+            print(f"📈 Metrics at http://{host}:{_server.server_port}/metrics")
+        return _server
@@ -0,0 +1,172 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from laggeddata import LAGS
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+LAG_STORE_PATH = os.environ.get(
+    'SNAPE_LAG_STORE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'lag_store.npy'),
+)
+
+# Hours kept per zone; one more than the largest lag so lag_24 and the current hour both fit
+SLOTS = max(LAGS) + 1
+
+HOUR_NS = 3_600_000_000_000
+
+
+def lag_store_path(city, path=None):
+    """
+    One ring buffer file per city, next to `path` (LAG_STORE_PATH, read at call time)
+    """
+    base, ext = os.path.splitext(path or LAG_STORE_PATH)
+    return f'{base}_{city}{ext}'
+
+
+def hour_number(hour):
+    """
+    Hours since the epoch for a naive IST hour, the ring buffer's clock
+    """
+    return pd.Timestamp(hour).value // HOUR_NS
+
+
+class LagStore:
+    """
+    Per-zone hourly counts in a memory-mapped ring buffer of SLOTS hours.
+
+    Row `h % SLOTS` holds hour number h: column 0 is the hour stamp, the rest
+    one count per zone. A lag lookup is a direct row read, checked against
+    the stamp, so building the feature vector costs the same however much
+    history has been fed in. A sidecar JSON keeps the zone order, the
+    newest hour written and the first hour still open; the file survives
+    restarts.
+    """
+    def __init__(self, zones, path=LAG_STORE_PATH, slots=SLOTS):
+        self.zones = list(zones)
+        self.path = path
+        self.slots = slots
+        self.meta_path = os.path.splitext(path)[0] + '.json'
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._ring = self._open()
+
+    def _open(self):
+        meta = self._read_meta()
+        shape = (self.slots, 1 + len(self.zones))
+        if meta.get('zones') == self.zones and meta.get('slots') == self.slots and os.path.exists(self.path):
+            ring = np.lib.format.open_memmap(self.path, mode='r+')
+            if ring.shape == shape:
+                return ring
+        # New store, or the zones changed: start empty
+        ring = np.lib.format.open_memmap(self.path, mode='w+', dtype=np.float64, shape=shape)
+        ring[:] = np.nan
+        ring.flush()
+        self._write_meta(None)
+        return ring
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_meta(self, newest, open_from=None):
+        tmp_path = f'{self.meta_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'zones': self.zones, 'slots': self.slots, 'newest': newest, 'open': open_from}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    @contextmanager
+    def _locked(self):
+        # Other processes (dashboard, scheduler) may share the file
+        with self._lock, open(self.path, 'rb') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    @property
+    def newest(self):
+        return self._read_meta().get('newest')
+
+    def update(self, counts, now=None):
+        """
+        Write the hours of an (hour x zone) count matrix that are not final in the store yet.
+
+        `now` is when the counts were fetched (defaults to the last hour of the matrix).
+        An hour is final once a write fetched at least an hour after it began: every hour
+        newer than `now` - 1h may still be missing bookings, however far the matrix's
+        calendar reaches, so it stays open and is rewritten by the next update. Hours
+        that closed before are kept as they are. Returns the number of hours written.
+        """
+        if counts.empty:
+            return 0
+        hours = np.array([hour_number(hour) for hour in counts.index])
+        values = counts.reindex(columns=self.zones, fill_value=0).to_numpy(dtype=np.float64)
+        fetched = hour_number(now if now is not None else counts.index[-1])
+
+        with self._locked():
+            meta = self._read_meta()
+            newest, open_from = meta.get('newest'), meta.get('open')
+            write = hours >= open_from if open_from is not None else np.ones(len(hours), dtype=bool)
+            write &= hours > hours.max() - self.slots
+            rows = hours[write] % self.slots
+            self._ring[rows, 0] = hours[write]
+            self._ring[rows, 1:] = values[write]
+            self._ring.flush()
+            newest = int(max(hours.max(), newest if newest is not None else hours.max()))
+            open_from = int(max(fetched - 1, open_from if open_from is not None else fetched - 1))
+            self._write_meta(newest, open_from)
+        return int(write.sum())
+
+    def lag_vector(self, hour, lags=LAGS):
+        """
+        (1 + len(lags), zones) array: the counts at `hour` and at each lag before it.
+        Hours the store does not hold come back as NaN.
+        """
+        current = hour_number(hour)
+        wanted = np.array([current] + [current - lag for lag in lags])
+        rows = self._ring[wanted % self.slots]
+        vector = rows[:, 1:].copy()
+        vector[rows[:, 0] != wanted] = np.nan
+        return vector
+
+    def features(self, hour, lags=LAGS):
+        """
+        Same frame as laggeddata.build_lag_features: one row per zone with `y` and `lag_<n>`
+        """
+        vector = self.lag_vector(hour, lags)
+        return pd.DataFrame(
+            vector.T,
+            index=pd.Index(self.zones, name='zone'),
+            columns=['y'] + [f'lag_{lag}' for lag in lags],
+        )
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_lag_store(zones, path=LAG_STORE_PATH):
+    """
+    One open store per (path, zones) in the process
+    """
+    key = (path, tuple(zones))
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = LagStore(zones, path)
+        return _stores[key]
@@ -1,37 +1,58 @@
-from dataprocess import *
-
-
-for lag in [1, 8, 12, 24]:
-    hourly_demand[f'lag_{lag}'] = hourly_demand['y'].shift(lag)
-
-for lag in [1, 8, 12, 24]:
-    hourly_demand_airpot[f'lag_{lag}'] = hourly_demand_airpot['y'].shift(lag)
-
-for lag in [1, 8, 12, 24]:
-    hourly_demand_laketown[f'lag_{lag}'] = hourly_demand_laketown['y'].shift(lag)
-
-for lag in [1, 8, 12, 24]:
-    hourly_demand_howrah[f'lag_{lag}'] = hourly_demand_howrah['y'].shift(lag)
-
-for lag in [1, 8, 12, 24]:
-    hourly_demand_rabindrasadan[f'lag_{lag}'] = hourly_demand_rabindrasadan['y'].shift(lag)
-
-for lag in [1, 8, 12, 24]:
-    hourly_demand_sectorV[f'lag_{lag}'] = hourly_demand_sectorV['y'].shift(lag)
-
-hourly_demand= hourly_demand.tail(1)
-
-hourly_demand_airpot= hourly_demand_airpot.tail(1)
-hourly_demand_laketown= hourly_demand_laketown.tail(1)
-hourly_demand_howrah= hourly_demand_howrah.tail(1)
-hourly_demand_rabindrasadan= hourly_demand_rabindrasadan.tail(1)
-hourly_demand_sectorV= hourly_demand_sectorV.tail(1)
-
-
-
-print("city",hourly_demand)
-print("laketown",hourly_demand_laketown)
-print("airpor",hourly_demand_airpot)
-print('howrah',hourly_demand_howrah)
-print('rabindrasadan',hourly_demand_rabindrasadan)
-print('sector5',hourly_demand_sectorV)
\ No newline at end of file
+import os
+import numpy as np
+import pandas as pd
+
+LAGS = [1, 8, 12, 24]
+
+# What to do with NaN y/lag values before scaling: 'impute' or 'reject'
+NAN_POLICY = os.environ.get('SNAPE_NAN_POLICY', 'impute')
+
+def build_lag_features(counts, lags=LAGS):
+    """
+    Current-hour demand and its lags for every zone column of an (hour x zone) count matrix.
+    Returns one row per zone with `y` and `lag_<n>` columns (NaN where history is too short).
+    """
+    n_hours = len(counts)
+    features = pd.DataFrame(index=pd.Index(counts.columns, name='zone'))
+    features['y'] = counts.iloc[-1].astype(float) if n_hours else np.nan
+
+    # Same values as counts.shift(lag).tail(1), without shifting the whole frame
+    for lag in lags:
+        features[f'lag_{lag}'] = counts.iloc[n_hours - 1 - lag].astype(float) if n_hours > lag else np.nan
+
+    print("lagged", features.shape)
+    return features
+
+def build_lag_panel(counts, lags=LAGS):
+    """
+    `y` and `lag_<n>` for every hour of an (hour x zone) count matrix, one vectorized shift per lag.
+    Returns {column: (hour x zone) frame}; the last row of each matches build_lag_features(counts).
+    """
+    counts = counts.astype(float)
+    panel = {'y': counts}
+    for lag in lags:
+        panel[f'lag_{lag}'] = counts.shift(lag)
+    return panel
+
+def validate_lag_features(features, lags=LAGS, policy=NAN_POLICY):
+    """
+    Check `y` and `lag_<n>` of every zone for NaN in one vectorized pass, before they reach the scalers.
+
+    'impute' fills a gap from the nearest shorter lag (then the nearest longer one,
+    then 0), so a missing lag_24 becomes lag_12; 'reject' raises ValueError.
+    """
+    columns = ['y'] + [f'lag_{lag}' for lag in sorted(lags)]
+    values = features[columns].to_numpy(dtype=float)
+    missing = np.isnan(values)
+    if not missing.any():
+        return features
+
+    gaps = {zone: [c for c, m in zip(columns, row) if m] for zone, row in zip(features.index, missing) if row.any()}
+    if policy == 'reject':
+        raise ValueError(f"NaN lag features: {gaps}")
+
+    filled = pd.DataFrame(values).ffill(axis=1).bfill(axis=1).fillna(0.0).to_numpy()
+    print(f"⚠️ Imputed missing lag features: {gaps}")
+    features = features.copy()
+    features[columns] = filled
+    return features
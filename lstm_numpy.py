@@ -0,0 +1,328 @@
+import os
+import sys
+import json
+import glob
+import hashlib
+import argparse
+import warnings
+import numpy as np
+
+MODEL_DIRS = ['models', 'test_models']
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0.0, 1.0),
+    'relu': lambda x: np.maximum(x, 0.0),
+}
+
+
+def _activation(name):
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {name}")
+    return ACTIVATIONS[name]
+
+
+def export_weights(h5_path):
+    """
+    Read a Keras Sequential LSTM/Dense model straight from its .h5 file (h5py only, no TensorFlow).
+    Returns (layers, arrays): a JSON-able layer list and the weight arrays it refers to.
+    """
+    import h5py
+
+    layers = []
+    arrays = {}
+    with h5py.File(h5_path, 'r') as f:
+        config = json.loads(f.attrs['model_config'])
+        if config['class_name'] != 'Sequential':
+            raise ValueError(f"{h5_path}: only Sequential models are supported")
+        weights = f['model_weights']
+
+        for layer in config['config']['layers']:
+            kind, cfg = layer['class_name'], layer['config']
+            if kind in ('InputLayer', 'Dropout'):
+                # Dropout is the identity at inference time
+                continue
+            if kind not in ('LSTM', 'Dense'):
+                raise ValueError(f"{h5_path}: unsupported layer {kind}")
+            if kind == 'LSTM' and (cfg.get('go_backwards') or cfg.get('stateful') or cfg.get('return_state')):
+                raise ValueError(f"{h5_path}: unsupported LSTM options on {cfg['name']}")
+
+            group = weights[cfg['name']]
+            names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs['weight_names']]
+            found = {}
+            for name in names:
+                short = name.rsplit('/', 1)[-1].split(':')[0]
+                found[short] = np.asarray(group[name], dtype=np.float32)
+
+            i = len(layers)
+            spec = {'kind': kind, 'activation': cfg.get('activation', 'linear')}
+            arrays[f'{i}_kernel'] = found['kernel']
+            arrays[f'{i}_bias'] = found.get('bias', np.zeros(found['kernel'].shape[1], dtype=np.float32))
+            if kind == 'LSTM':
+                arrays[f'{i}_recurrent_kernel'] = found['recurrent_kernel']
+                spec['units'] = cfg['units']
+                spec['recurrent_activation'] = cfg.get('recurrent_activation', 'sigmoid')
+                spec['return_sequences'] = cfg.get('return_sequences', False)
+            layers.append(spec)
+
+    return layers, arrays
+
+
+def file_hash(path):
+    """
+    sha256 of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def recorded_sources(path):
+    """
+    {source: sha256} of the files an export was built from, {} for exports that predate the record
+    """
+    with np.load(path) as data:
+        return json.loads(str(data['sources'])) if 'sources' in data.files else {}
+
+
+def _save(out_path, layers, arrays, sources):
+    # File hashes rather than mtimes: a fresh checkout gives every file an arbitrary mtime
+    sources = {name: file_hash(path) for name, path in sources.items()}
+    np.savez(out_path, layers=np.array(json.dumps(layers)), sources=np.array(json.dumps(sources)), **arrays)
+    return out_path
+
+
+def npz_path(h5_path):
+    return os.path.splitext(h5_path)[0] + '.npz'
+
+
+def predictor_path(model_dir, zone):
+    return os.path.join(model_dir, f'predictor_{zone}.npz')
+
+
+def scaler_affine(scaler):
+    """
+    (scale, offset) with scaler.transform(x) == x * scale + offset, for MinMaxScaler and StandardScaler
+    """
+    if hasattr(scaler, 'min_'):
+        if getattr(scaler, 'clip', False):
+            raise ValueError("MinMaxScaler(clip=True) is not affine and cannot be folded")
+        return np.asarray(scaler.scale_, dtype=np.float64), np.asarray(scaler.min_, dtype=np.float64)
+    if hasattr(scaler, 'mean_') or hasattr(scaler, 'scale_'):
+        scale = np.asarray(scaler.scale_, dtype=np.float64) if scaler.scale_ is not None else 1.0
+        mean = np.asarray(scaler.mean_, dtype=np.float64) if scaler.mean_ is not None else 0.0
+        scale = np.broadcast_to(1.0 / scale, (scaler.n_features_in_,))
+        return scale, -np.broadcast_to(mean, (scaler.n_features_in_,)) * scale
+    raise ValueError(f"Unsupported scaler: {type(scaler).__name__}")
+
+
+def fold_scalers(layers, arrays, scaler_X, scaler_y):
+    """
+    Fold the input scaler into the first layer and the output inverse transform into the last one.
+
+    (x * a + b) @ W + c == x @ (a[:, None] * W) + (b @ W + c) for the input side, and
+    (h @ W + c - b) / a == h @ (W / a) + (c - b) / a for a linear output layer.
+    """
+    if layers[-1]['kind'] != 'Dense' or layers[-1]['activation'] != 'linear':
+        raise ValueError("The output inverse transform can only be folded into a linear Dense layer")
+    arrays = dict(arrays)
+    last = len(layers) - 1
+
+    scale, offset = scaler_affine(scaler_X)
+    kernel = arrays['0_kernel'].astype(np.float64)
+    arrays['0_bias'] = (offset @ kernel + arrays['0_bias']).astype(np.float32)
+    arrays['0_kernel'] = (scale[:, None] * kernel).astype(np.float32)
+
+    scale, offset = scaler_affine(scaler_y)
+    arrays[f'{last}_kernel'] = (arrays[f'{last}_kernel'].astype(np.float64) / scale).astype(np.float32)
+    arrays[f'{last}_bias'] = ((arrays[f'{last}_bias'] - offset) / scale).astype(np.float32)
+    return layers, arrays
+
+
+def compile_predictor(model_dir, zone, out_path=None):
+    """
+    Write predictor_<zone>.npz: the zone's LSTM with both scalers folded into its weights.
+    Takes raw feature rows and returns rides, so serving needs neither joblib nor sklearn.
+    """
+    import joblib
+
+    sources = {
+        'model': os.path.join(model_dir, f'lstm_{zone}.h5'),
+        'scaler_x': os.path.join(model_dir, f'scaler_x_{zone}.pkl'),
+        'scaler_y': os.path.join(model_dir, f'scaler_y_{zone}.pkl'),
+    }
+    layers, arrays = export_weights(sources['model'])
+    scaler_X = joblib.load(sources['scaler_x'])
+    scaler_y = joblib.load(sources['scaler_y'])
+    layers, arrays = fold_scalers(layers, arrays, scaler_X, scaler_y)
+    return _save(out_path or predictor_path(model_dir, zone), layers, arrays, sources)
+
+
+def check_folded_parity(model_dir, zone, n_samples=256, seed=0):
+    """
+    Relative max difference between the folded predictor and scaler_X -> LSTM -> scaler_y on raw inputs
+    """
+    import joblib
+
+    scaler_X = joblib.load(os.path.join(model_dir, f'scaler_x_{zone}.pkl'))
+    scaler_y = joblib.load(os.path.join(model_dir, f'scaler_y_{zone}.pkl'))
+    model = NumpyLSTM(*export_weights(os.path.join(model_dir, f'lstm_{zone}.h5')))
+    folded = NumpyLSTM.load(predictor_path(model_dir, zone))
+
+    # Raw inputs mapped back from the scaled range the model was trained on
+    scaled = np.random.default_rng(seed).uniform(0.0, 1.0, size=(n_samples, scaler_X.n_features_in_))
+    x = scaler_X.inverse_transform(scaled)
+    expected = scaler_y.inverse_transform(model.predict(scaled.reshape(n_samples, 1, -1)))
+    actual = folded.predict(x.reshape(n_samples, 1, -1))
+    return float(np.max(np.abs(expected - actual)) / max(1.0, float(np.max(np.abs(expected)))))
+
+
+def export_model(h5_path, out_path=None):
+    """
+    Export one .h5 model to a .npz next to it (or at `out_path`)
+    """
+    layers, arrays = export_weights(h5_path)
+    return _save(out_path or npz_path(h5_path), layers, arrays, {'model': h5_path})
+
+
+class NumpyLSTM:
+    """
+    Pure NumPy evaluation of an exported stacked-LSTM + Dense model.
+
+    Follows Keras' LSTM cell: gates in i, f, c, o order, zero initial state.
+    """
+    def __init__(self, layers, arrays):
+        self.layers = []
+        for i, spec in enumerate(layers):
+            layer = dict(spec)
+            layer['kernel'] = arrays[f'{i}_kernel']
+            layer['bias'] = arrays[f'{i}_bias']
+            if spec['kind'] == 'LSTM':
+                layer['recurrent_kernel'] = arrays[f'{i}_recurrent_kernel']
+            self.layers.append(layer)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            layers = json.loads(str(data['layers']))
+            arrays = {key: data[key] for key in data.files if key not in ('layers', 'sources')}
+        return cls(layers, arrays)
+
+    @staticmethod
+    def _lstm(x, layer):
+        activation = _activation(layer['activation'])
+        recurrent_activation = _activation(layer['recurrent_activation'])
+        units = layer['units']
+        n, steps, _ = x.shape
+
+        # Input projections for every timestep at once
+        projected = x @ layer['kernel'] + layer['bias']
+        h = np.zeros((n, units), dtype=x.dtype)
+        c = np.zeros((n, units), dtype=x.dtype)
+        outputs = []
+        for t in range(steps):
+            z = projected[:, t]
+            if t:
+                z = z + h @ layer['recurrent_kernel']
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            g = activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * activation(c)
+            outputs.append(h)
+        return np.stack(outputs, axis=1) if layer['return_sequences'] else h
+
+    def predict(self, x, verbose=0):
+        """
+        Same contract as keras Model.predict for these models: (n, steps, features) -> (n, units)
+        """
+        x = np.asarray(x, dtype=np.float32)
+        for layer in self.layers:
+            if layer['kind'] == 'LSTM':
+                x = self._lstm(x, layer)
+            else:
+                x = _activation(layer['activation'])(x @ layer['kernel'] + layer['bias'])
+        return x
+
+    __call__ = predict
+
+
+def load_keras_model(h5_path):
+    """
+    Keras model from an .h5 file, including LSTMs saved by older Keras with a `time_major` argument
+    """
+    from tensorflow.keras.layers import LSTM
+    from tensorflow.keras.models import load_model
+
+    class LegacyLSTM(LSTM):
+        def __init__(self, *args, time_major=False, **kwargs):
+            if time_major:
+                raise ValueError(f"{h5_path}: time-major LSTMs are not supported")
+            super().__init__(*args, **kwargs)
+
+    return load_model(h5_path, compile=False, custom_objects={'LSTM': LegacyLSTM})
+
+
+def check_parity(h5_path, n_samples=256, atol=1e-4, seed=0):
+    """
+    Max absolute difference between Keras and NumPy outputs on random inputs in the scaled range,
+    whether it is within `atol`, and the model's number of input features
+    """
+    keras_model = load_keras_model(h5_path)
+    numpy_model = NumpyLSTM(*export_weights(h5_path))
+    _, steps, n_features = keras_model.input_shape
+    x = np.random.default_rng(seed).uniform(-0.5, 1.5, size=(n_samples, steps or 1, n_features)).astype(np.float32)
+
+    expected = keras_model(x, training=False).numpy()
+    actual = numpy_model.predict(x)
+    diff = float(np.max(np.abs(expected - actual)))
+    return diff, diff <= atol, n_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export LSTM models to NumPy and check parity with Keras")
+    parser.add_argument('command', choices=['export', 'parity', 'compile'])
+    parser.add_argument('dirs', nargs='*', default=MODEL_DIRS)
+    args = parser.parse_args()
+    # The pickled scalers come from an older sklearn; only this offline tool still unpickles them
+    warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    paths = sorted(p for d in args.dirs for p in glob.glob(os.path.join(root, d, 'lstm_*.h5')))
+    failed = False
+    for path in paths:
+        name = os.path.relpath(path, root)
+        if args.command == 'export':
+            print(f"📦 {name} -> {os.path.relpath(export_model(path), root)}")
+        elif args.command == 'compile':
+            model_dir = os.path.dirname(path)
+            zone = os.path.basename(path)[len('lstm_'):-len('.h5')]
+            try:
+                out_path = compile_predictor(model_dir, zone)
+                diff = check_folded_parity(model_dir, zone)
+            except Exception as e:
+                failed = True
+                print(f"❌ {name}: could not compile ({e})")
+                continue
+            ok = diff <= 1e-4
+            failed |= not ok
+            print(f"{'✅' if ok else '❌'} {name} -> {os.path.relpath(out_path, root)} (max relative diff {diff:.2e})")
+        else:
+            try:
+                diff, ok, n_features = check_parity(path)
+            except Exception as e:
+                failed = True
+                print(f"❌ {name}: could not compare ({e})")
+                continue
+            failed |= not ok
+            print(f"{'✅' if ok else '❌'} {name} ({n_features} features): max |keras - numpy| = {diff:.2e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,40 @@
-import Script_fetch_from_db
-import Parse
-import process
-import dataprocess
-import laggeddata
-import weatherunion_script
-import model_predict
-import main
+import argparse
+from datetime import timedelta
+
+from scheduler import PredictionScheduler
+from timeslots import hour_slot, ist_now
 
 def main():
-    Script_fetch_from_db.run()
-    Parse.run()
-    process.run()
-    dataprocess.run()
-    laggeddata.run()
-    weatherunion_script.run()
-    model_predict.run()
-    main.run()
-    
+    parser = argparse.ArgumentParser(description="Run the demand prediction pipeline and store snapshots")
+    parser.add_argument('--daemon', action='store_true', help="keep running: precompute every hour at :55 and refresh it at :05")
+    parser.add_argument('--next', action='store_true', help="compute the upcoming hour's slot instead of the current one")
+    parser.add_argument('--city', action='append', help="catalog city to serve; repeat for several (default: SNAPE_CITY or the catalog's default)")
+    parser.add_argument('--metrics-port', type=int, default=None, help="serve Prometheus metrics on this port (daemon mode)")
+    args = parser.parse_args()
+
+    scheduler = PredictionScheduler(cities=args.city)
+    if args.daemon:
+        from instrumentation import METRICS_PORT, start_metrics_server
+        start_metrics_server(args.metrics_port or METRICS_PORT)
+        scheduler.run_forever()
+        return None
+
+    now = ist_now()
+    slot = hour_slot(now) + timedelta(hours=1) if args.next else hour_slot(now)
+    predictions = {}
+    for city in scheduler.cities:
+        snapshot = scheduler.run_once(slot, now, city)
+        for stage, seconds in snapshot['timings'].items():
+            print(f"{stage:15s}: {seconds:.3f}s")
+        print(f"Predicted values ({city}): {snapshot['predictions']}")
+        if 'forecast' in snapshot:
+            print("Forecast:")
+            for i, hour in enumerate(snapshot['forecast']['hours']):
+                values = ', '.join(f"{zone} {v[i]:.1f}" for zone, v in snapshot['forecast']['zones'].items())
+                print(f"  {hour}: {values}")
+        predictions[city] = snapshot['predictions']
+    return predictions
+
 
 if __name__ == "__main__":
     main()
-
-
-
-
-
-
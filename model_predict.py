@@ -1,22 +1,18 @@
-from weatherunion_script import *
-import joblib
-from tensorflow.keras.models import load_model
-import warnings
+import numpy as np
+from model_registry import registry
+from weatherunion_script import FEATURE_COLUMNS
+from reconcile import RECONCILE_METHOD, reconcile, reconcile_frame
 
-# Suppress the sklearn version warning
-warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
-
-def predict_demand_for_zone(zone, hourly_demand):
+def predict_demand_for_zone(zone, features):
     try:
         print(f"🔄 Predicting for {zone}...")
         
-        # Load the LSTM model (keeping your original paths)
-        model = load_model(f'./models/lstm_{zone}.h5')
-        scaler_X = joblib.load(f'./models/scaler_x_{zone}.pkl')
-        scaler_y = joblib.load(f'./models/scaler_y_{zone}.pkl')
+        # Model (and scalers, unless folded into the model) are loaded once per process by the registry
+        artifacts = registry.get(zone)
+        model = artifacts.model
 
-        # Extract hourly demand for the given zone
-        hourly_demand_zone = hourly_demand[zone]
+        # Extract the feature row for the given zone
+        hourly_demand_zone = features.loc[[zone], FEATURE_COLUMNS]
         
         # Debug: Print input data
         print(f"  Input data shape: {hourly_demand_zone.shape}")
@@ -24,11 +20,10 @@ def predict_demand_for_zone(zone, hourly_demand):
         new_sample = hourly_demand_zone.values
         new_sample = new_sample.reshape(1, -1)
 
-        new_sample_scaled = scaler_X.transform(new_sample)
-        new_sample_reshaped = new_sample_scaled.reshape((new_sample_scaled.shape[0], 1, new_sample_scaled.shape[1]))
+        new_sample_reshaped = artifacts.prepare(new_sample)
 
         y_pred_scaled = model.predict(new_sample_reshaped, verbose=0)
-        y_pred = scaler_y.inverse_transform(y_pred_scaled)
+        y_pred = artifacts.finish(y_pred_scaled)
 
         predicted_value = y_pred.flatten()[0]
         final_value = max(0, predicted_value)
@@ -40,92 +35,140 @@ def predict_demand_for_zone(zone, hourly_demand):
         print(f"  ❌ Error predicting {zone}: {e}")
         return 0
 
-def correct_zone_predictions(raw_predictions):
+def predict_demand_batch(features, zones):
     """
-    Correct zone predictions to ensure they don't exceed city total
+    Predict demand for several zones with a single compiled forward pass.
+    Returns the same {zone: rides} dict as calling predict_demand_for_zone per zone.
     """
-    print("\n🔧 APPLYING LOGIC CORRECTION...")
-    
-    # Separate city total from zones
-    city_total = raw_predictions.get('kolkata_city', 0)
-    zone_predictions = {k: v for k, v in raw_predictions.items() if k != 'kolkata_city'}
-    
-    # Calculate current zone sum
-    zone_sum = sum(zone_predictions.values())
-    
-    print(f"City Total: {city_total:.1f}")
-    print(f"Zone Sum (raw): {zone_sum:.1f}")
-    
-    if zone_sum > city_total:
-        # Apply proportional scaling to zones
-        scaling_factor = (city_total * 0.8) / zone_sum  # Use 80% of city total for zones
-        print(f"Scaling factor: {scaling_factor:.3f}")
-        
-        corrected_predictions = {}
-        for zone, prediction in zone_predictions.items():
-            corrected_value = prediction * scaling_factor
-            corrected_predictions[zone] = corrected_value
-            print(f"  {zone}: {prediction:.1f} → {corrected_value:.1f}")
-        
-        # Keep city total as is
-        corrected_predictions['kolkata_city'] = city_total
-        
-        # Verify correction
-        new_zone_sum = sum([v for k, v in corrected_predictions.items() if k != 'kolkata_city'])
-        print(f"New zone sum: {new_zone_sum:.1f}")
-        print(f"Remaining for other areas: {city_total - new_zone_sum:.1f}")
-        
-        return corrected_predictions
-    else:
+    predictions = {}
+    batch_zones = []
+    batch_inputs = []
+
+    for zone in zones:
+        try:
+            artifacts = registry.get(zone)
+            new_sample = features.loc[[zone], FEATURE_COLUMNS].values.reshape(1, -1)
+            batch_inputs.append(artifacts.prepare(new_sample))
+            batch_zones.append(zone)
+        except Exception as e:
+            print(f"  ❌ Error preparing {zone}: {e}")
+            predictions[zone] = 0
+
+    if batch_zones:
+        try:
+            print(f"🔄 Predicting for {len(batch_zones)} zones in one pass...")
+            forward = registry.batch_forward(batch_zones)
+            outputs = forward(batch_inputs)
+            for zone, y_pred_scaled in zip(batch_zones, outputs):
+                y_pred = registry.get(zone).finish(y_pred_scaled)
+                predictions[zone] = max(0, y_pred.flatten()[0])
+                print(f"  ✅ {zone}: {predictions[zone]:.1f} rides (raw)")
+        except Exception as e:
+            print(f"  ❌ Batched prediction failed ({e}), falling back to per-zone predictions")
+            for zone in batch_zones:
+                predictions[zone] = predict_demand_for_zone(zone, features)
+
+    # Keep the caller's zone order
+    return {zone: predictions[zone] for zone in zones}
+
+def predict_zone_rows(zones, rows_by_zone):
+    """
+    Predict any number of raw feature rows per zone (columns ordered like FEATURE_COLUMNS)
+    in a single forward pass. Returns one array of rides per zone, clipped at 0.
+    """
+    artifacts = [registry.get(zone) for zone in zones]
+    inputs = [a.prepare(rows) for a, rows in zip(artifacts, rows_by_zone)]
+    outputs = registry.batch_forward(list(zones))(inputs)
+    return [np.maximum(a.finish(y).reshape(-1), 0.0) for a, y in zip(artifacts, outputs)]
+
+def predict_matrix(zones, rows):
+    """
+    Predict one raw feature row per zone in a single forward pass. Returns an array of rides.
+    """
+    return np.concatenate(predict_zone_rows(zones, [rows[i:i + 1] for i in range(len(zones))]))
+
+def correct_zone_predictions(raw_predictions, method=RECONCILE_METHOD, city_zone=None):
+    """
+    Correct zone predictions to ensure they don't exceed city total (see reconcile.py for the methods).
+    `city_zone` defaults to the zone catalog's default city total.
+    """
+    if city_zone is None:
+        from zone_catalog import get_zone_catalog
+        city_zone = get_zone_catalog().city().city_zone
+    print(f"\n🔧 APPLYING LOGIC CORRECTION ({method})...")
+
+    zones = [zone for zone in raw_predictions if zone != city_zone]
+    raw = np.array([[raw_predictions[zone] for zone in zones] + [raw_predictions.get(city_zone, 0)]])
+    corrected = reconcile(raw, method)[0]
+
+    print(f"City Total: {raw[0, -1]:.1f}")
+    print(f"Zone Sum (raw): {raw[0, :-1].sum():.1f}")
+
+    if np.allclose(corrected, raw[0]):
         print("✅ No correction needed - zones sum is reasonable")
         return raw_predictions
 
-# Example usage:
-zones = ['airport', 'laketown', 'sectorV', 'victoria', 'howrah', 'kolkata_city']
-
-hourly_demand = {
-    'airport': hourly_demand_airpot,
-    'laketown': hourly_demand_laketown,
-    'sectorV': hourly_demand_sectorV,
-    'victoria': hourly_demand_rabindrasadan,
-    'howrah': hourly_demand_howrah,
-    'kolkata_city': hourly_demand
-}
-
-print("🚖 Starting Kolkata Demand Predictions...")
-print("="*50)
-
-# Get raw predictions
-raw_predicted_values = {}
-for zone in zones:
-    raw_predicted_values[zone] = predict_demand_for_zone(zone, hourly_demand)
-
-print("\n📊 RAW PREDICTIONS:")
-print("="*50)
-for zone, prediction in raw_predicted_values.items():
-    print(f"{zone:15s}: {prediction:6.1f} rides")
-
-# Apply logic correction
-predicted_values = correct_zone_predictions(raw_predicted_values)
-
-print("\n✅ CORRECTED PREDICTIONS:")
-print("="*50)
-for zone, prediction in predicted_values.items():
-    print(f"{zone:15s}: {prediction:6.1f} rides")
-
-# Final logic check
-print("\n🔍 FINAL VALIDATION:")
-zone_predictions = {k: v for k, v in predicted_values.items() if k != 'kolkata_city'}
-total_zone_demand = sum(zone_predictions.values())
-city_demand = predicted_values.get('kolkata_city', 0)
-
-print(f"Sum of 5 zones: {total_zone_demand:.1f}")
-print(f"Total city:     {city_demand:.1f}")
-print(f"Difference:     {city_demand - total_zone_demand:.1f} (other areas)")
-
-if total_zone_demand <= city_demand:
-    print("✅ Logic check passed!")
-else:
-    print("⚠️  Still have issues - manual adjustment needed")
-
-print(f"\nFinal predicted_values: {predicted_values}")
\ No newline at end of file
+    for zone, before, after in zip(zones, raw[0], corrected):
+        print(f"  {zone}: {before:.1f} → {after:.1f}")
+    corrected_predictions = dict(zip(zones, corrected.tolist()))
+    corrected_predictions[city_zone] = float(corrected[-1])
+
+    # Verify correction
+    new_zone_sum = corrected[:-1].sum()
+    print(f"New zone sum: {new_zone_sum:.1f}")
+    print(f"Remaining for other areas: {corrected[-1] - new_zone_sum:.1f}")
+    return corrected_predictions
+
+def correct_zone_matrix(raw_predictions, city_zone=None, method=RECONCILE_METHOD):
+    """
+    correct_zone_predictions applied to every row of an (hour x zone) frame at once, without the printout
+    """
+    return reconcile_frame(raw_predictions, method, city_zone)
+
+def run(features, zones=None, city_zone=None):
+    """
+    Predict every zone from its feature row and reconcile zones against the city total.
+    `zones` default to the model zones of the zone catalog's default city. Returns {zone: predicted rides}.
+    """
+    if zones is None or city_zone is None:
+        from zone_catalog import get_zone_catalog
+        city = get_zone_catalog().city()
+        zones = zones or city.model_zones
+        city_zone = city_zone or city.city_zone
+
+    print("🚖 Starting Demand Predictions...")
+    print("="*50)
+
+    # Get raw predictions
+    raw_predicted_values = predict_demand_batch(features, zones)
+
+    print("\n📊 RAW PREDICTIONS:")
+    print("="*50)
+    for zone, prediction in raw_predicted_values.items():
+        print(f"{zone:15s}: {prediction:6.1f} rides")
+
+    # Apply logic correction
+    predicted_values = correct_zone_predictions(raw_predicted_values, city_zone=city_zone)
+
+    print("\n✅ CORRECTED PREDICTIONS:")
+    print("="*50)
+    for zone, prediction in predicted_values.items():
+        print(f"{zone:15s}: {prediction:6.1f} rides")
+
+    # Final logic check
+    print("\n🔍 FINAL VALIDATION:")
+    zone_predictions = {k: v for k, v in predicted_values.items() if k != city_zone}
+    total_zone_demand = sum(zone_predictions.values())
+    city_demand = predicted_values.get(city_zone, 0)
+
+    print(f"Sum of {len(zone_predictions)} zones: {total_zone_demand:.1f}")
+    print(f"Total city:     {city_demand:.1f}")
+    print(f"Difference:     {city_demand - total_zone_demand:.1f} (other areas)")
+
+    if total_zone_demand <= city_demand:
+        print("✅ Logic check passed!")
+    else:
+        print("⚠️  Still have issues - manual adjustment needed")
+
+    print(f"\nFinal predicted_values: {predicted_values}")
+    return predicted_values
@@ -0,0 +1,224 @@
+import os
+import threading
+import warnings
+import numpy as np
+
+from instrumentation import instrumentation
+from zone_catalog import get_zone_catalog
+
+# Model directory of zones that are not in the zone catalog
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+# 'predictor' (folded predictor_<zone>.npz), 'numpy' (lstm_numpy, no TensorFlow), 'keras',
+# or 'auto': the first of those whose files exist and match the sources they were built from
+INFERENCE_BACKEND = os.environ.get('SNAPE_INFERENCE_BACKEND', 'auto')
+
+
+class ZoneArtifacts:
+    """
+    LSTM model plus its scaler_x / scaler_y pair for one zone.
+
+    A folded predictor has the scalers baked into its weights; scaler_X and
+    scaler_y are then None and prepare()/finish() only reshape.
+    """
+    def __init__(self, zone, model, scaler_X, scaler_y, mtimes, backend='keras'):
+        self.zone = zone
+        self.model = model
+        self.backend = backend
+        self.scaler_X = scaler_X
+        self.scaler_y = scaler_y
+        self.mtimes = mtimes
+
+    @property
+    def folded(self):
+        return self.scaler_X is None
+
+    def prepare(self, rows):
+        """
+        (n, n_features) raw feature rows -> (n, 1, n_features) float32 model input
+        """
+        rows = np.asarray(rows, dtype=np.float32 if self.folded else np.float64)
+        if not self.folded:
+            rows = self.scaler_X.transform(rows)
+        return rows.reshape((rows.shape[0], 1, rows.shape[1])).astype(np.float32, copy=False)
+
+    def finish(self, outputs):
+        """
+        Model outputs -> predicted rides, shape (n, 1)
+        """
+        outputs = np.asarray(outputs)
+        return outputs if self.folded else self.scaler_y.inverse_transform(outputs)
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of zone models and scalers.
+
+    Artifacts are loaded lazily on first use and reloaded when any of the
+    zone's files under the model directory changes on disk (mtime check).
+    """
+    def __init__(self, model_dir=None, backend=INFERENCE_BACKEND):
+        # None: each zone's files live in its city's model_dir from the zone catalog
+        self.model_dir = model_dir
+        self.backend = backend
+        self._artifacts = {}
+        self._lock = threading.Lock()
+        self._zone_locks = {}
+        self._batch_fns = {}
+
+    def locate(self, zone):
+        """
+        (model directory, artifact name) of a zone, as the zone catalog defines them
+        """
+        city = get_zone_catalog().city_for(zone)
+        name = city.model_name(zone) if city else zone
+        return self.model_dir or (city.model_dir if city else MODEL_DIR), name
+
+    def artifact_paths(self, zone):
+        model_dir, name = self.locate(zone)
+        return {
+            'model': os.path.join(model_dir, f'lstm_{name}.h5'),
+            'weights': os.path.join(model_dir, f'lstm_{name}.npz'),
+            'predictor': os.path.join(model_dir, f'predictor_{name}.npz'),
+            'scaler_x': os.path.join(model_dir, f'scaler_x_{name}.pkl'),
+            'scaler_y': os.path.join(model_dir, f'scaler_y_{name}.pkl'),
+        }
+
+    def backend_for(self, zone):
+        if self.backend != 'auto':
+            return self.backend
+        from lstm_numpy import file_hash, recorded_sources
+
+        paths = self.artifact_paths(zone)
+        # An export is used only if the .h5 and scalers it records still hash the same;
+        # sources missing from the deploy are not checked
+        for backend, name in (('predictor', 'predictor'), ('numpy', 'weights')):
+            if not os.path.exists(paths[name]):
+                continue
+            recorded = recorded_sources(paths[name])
+            if not recorded:
+                print(f"⚠️ {os.path.basename(paths[name])} records no source hashes, ignoring it (re-run lstm_numpy.py)")
+                continue
+            if all(file_hash(paths[source]) == digest for source, digest in recorded.items() if os.path.exists(paths[source])):
+                return backend
+            print(f"⚠️ {os.path.basename(paths[name])} was built from other model files, ignoring it")
+        return 'keras'
+
+    def _current_mtimes(self, zone):
+        # Files a backend does not need may be missing; adding or removing any of them triggers a reload
+        return {
+            name: os.path.getmtime(path) if os.path.exists(path) else None
+            for name, path in self.artifact_paths(zone).items()
+        }
+
+    def _zone_lock(self, zone):
+        with self._lock:
+            return self._zone_locks.setdefault(zone, threading.Lock())
+
+    def _load(self, zone, mtimes):
+        paths = self.artifact_paths(zone)
+        backend = self.backend_for(zone)
+        print(f"📦 Loading model artifacts for {zone} ({backend})...")
+        if backend == 'predictor':
+            from lstm_numpy import NumpyLSTM
+
+            return ZoneArtifacts(zone, NumpyLSTM.load(paths['predictor']), None, None, mtimes, backend)
+        if backend == 'numpy':
+            from lstm_numpy import NumpyLSTM, export_weights
+
+            if os.path.exists(paths['weights']):
+                model = NumpyLSTM.load(paths['weights'])
+            else:
+                model = NumpyLSTM(*export_weights(paths['model']))
+        else:
+            from lstm_numpy import load_keras_model
+
+            model = load_keras_model(paths['model'])
+
+        import joblib
+
+        with warnings.catch_warnings():
+            # The pickles come from an older sklearn; `python lstm_numpy.py compile` avoids loading them at all
+            warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+            scaler_X = joblib.load(paths['scaler_x'])
+            scaler_y = joblib.load(paths['scaler_y'])
+        return ZoneArtifacts(zone, model, scaler_X, scaler_y, mtimes, backend)
+
+    def get(self, zone):
+        """
+        Return the artifacts for a zone, loading or reloading them if needed
+        """
+        mtimes = self._current_mtimes(zone)
+        artifacts = self._artifacts.get(zone)
+        if artifacts is not None and artifacts.mtimes == mtimes:
+            return artifacts
+
+        # One loader per zone; other zones keep serving while this one loads
+        with self._zone_lock(zone):
+            artifacts = self._artifacts.get(zone)
+            if artifacts is None or artifacts.mtimes != mtimes:
+                if artifacts is not None:
+                    print(f"♻️ Model files changed for {zone}, reloading")
+                with instrumentation.measure('model_load', zone=zone):
+                    artifacts = self._load(zone, mtimes)
+                self._artifacts[zone] = artifacts
+            return artifacts
+
+    def batch_forward(self, zones):
+        """
+        Return a function running every zone's LSTM in one call.
+
+        The function takes a list of (n, 1, n_features) inputs ordered like
+        `zones` and returns the list of scaled outputs. NumPy models are called
+        directly and the Keras ones share one compiled tf.function, so a mix of
+        backends never goes through Keras' per-call predict(). It is rebuilt
+        only when one of the zone models is reloaded.
+        """
+        artifacts = [self.get(zone) for zone in zones]
+        models = [a.model for a in artifacts]
+        key = (tuple(zones), tuple(id(model) for model in models))
+        forward = self._batch_fns.get(key)
+        if forward is None:
+            keras_index = [i for i, a in enumerate(artifacts) if a.backend == 'keras']
+            numpy_index = [i for i, a in enumerate(artifacts) if a.backend != 'keras']
+            compiled = None
+            if keras_index:
+                import tensorflow as tf
+
+                keras_models = [models[i] for i in keras_index]
+
+                @tf.function(reduce_retracing=True)
+                def compiled(inputs):
+                    return [model(x, training=False) for model, x in zip(keras_models, inputs)]
+
+            def forward(inputs):
+                outputs = [None] * len(models)
+                if compiled is not None:
+                    for i, y in zip(keras_index, compiled([inputs[i] for i in keras_index])):
+                        outputs[i] = y
+                # NumPy models are plain function calls, there is nothing to compile
+                for i in numpy_index:
+                    outputs[i] = models[i].predict(inputs[i])
+                return outputs
+
+            with self._lock:
+                # Drop functions that captured models which have since been reloaded
+                self._batch_fns = {k: v for k, v in self._batch_fns.items() if k[0] != key[0]}
+                self._batch_fns[key] = forward
+        return forward
+
+    def loaded_zones(self):
+        return list(self._artifacts)
+
+    def clear(self):
+        with self._lock:
+            self._artifacts.clear()
+            self._batch_fns.clear()
+
+
+# Shared by every caller (and every Streamlit session) in this process
+registry = ModelRegistry()
+
+
+def get_registry():
+    return registry
@@ -0,0 +1,272 @@
+import threading
+from functools import partial
+from collections import OrderedDict
+
+from Script_fetch_from_db import FETCH_MODE, fetch_bookings, fetch_hourly_counts
+from Parse import parse_bookings
+from process import assign_zones
+from dataprocess import hour_calendar, hourly_zone_counts
+from laggeddata import build_lag_features, validate_lag_features
+from lag_store import get_lag_store, hour_number, lag_store_path
+from weatherunion_script import add_weather_features
+from geofence import get_zone_index
+from zone_catalog import get_zone_catalog
+from timeslots import IST, ist_now, to_ist, hour_slot
+from forecast import HORIZON_HOURS, recursive_forecast
+from instrumentation import instrumentation
+
+
+def get_city(city=None):
+    """
+    A city of the zone catalog; the default city when `city` is None
+    """
+    return get_zone_catalog().city(city)
+
+
+# -- Stages: each takes the previous stage's output and the run time; build_pipeline binds the city --
+
+def fetch_stage(_, now, city=None):
+    return fetch_bookings(now=now)
+
+def parse_stage(bookings, now, city=None):
+    return parse_bookings(bookings)
+
+def geofence_stage(deduped, now, city=None):
+    return assign_zones(deduped, get_zone_index(city))
+
+def aggregate_stage(tagged, now, city=None):
+    zones = get_city(city)
+    return hourly_zone_counts(tagged, get_zone_index(city).zone_names, zones.city_zone, calendar=hour_calendar(now))
+
+def fetch_counts_stage(_, now, city=None):
+    zones = get_city(city)
+    return fetch_hourly_counts(now=now, zones=zones.geofences(), city_zone=zones.city_zone, calendar=hour_calendar(now))
+
+def lag_stage(counts, now, city=None):
+    zones = get_city(city)
+    columns = zones.model_zones
+    counts = counts.reindex(columns=columns, fill_value=0)
+    store = get_lag_store(columns, lag_store_path(zones.key))
+    newest = store.newest
+    if not counts.empty and (newest is None or hour_number(counts.index[-1]) >= newest):
+        # Only the hours not yet final in the ring buffer are written; the lags are a direct read
+        store.update(counts, now)
+        features = store.features(counts.index[-1])
+    else:
+        # Runs for an older slot must not see hours the store has recorded since
+        features = build_lag_features(counts)
+    features.index = list(columns)
+    return features
+
+def weather_stage(features, now, city=None):
+    return add_weather_features(features, get_city(city).weather_locations())
+
+def validate_stage(features, now, city=None):
+    return validate_lag_features(features)
+
+def predict_stage(features, now, city=None):
+    # Imported here so the model stack only loads when a prediction is actually made
+    import model_predict
+    zones = get_city(city)
+    return model_predict.run(features, zones.model_zones, zones.city_zone)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution; every caller gets its result
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            call['done'].wait()
+        else:
+            try:
+                call['result'] = func()
+            except BaseException as e:
+                call['error'] = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call['done'].set()
+
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+
+class Stage:
+    def __init__(self, name, func, cacheable=True):
+        self.name = name
+        self.func = func
+        self.cacheable = cacheable
+
+
+class PipelineRun:
+    """
+    Outputs, wall times and instrumentation records of every stage of one run
+    """
+    def __init__(self, now, slot):
+        self.now = now
+        self.slot = slot
+        self.outputs = {}
+        self.timings = {}
+        self.cache_hits = set()
+        self.diagnostics = instrumentation.start_run(slot)
+
+    @property
+    def records(self):
+        return self.diagnostics['stages']
+
+    @property
+    def predicted_values(self):
+        return self.outputs.get('predict')
+
+    def last_output(self):
+        return list(self.outputs.values())[-1] if self.outputs else None
+
+
+class Pipeline:
+    """
+    Ordered stages passing DataFrames along.
+
+    Each cacheable stage's output is kept per IST hour slot, so calling run()
+    again within the same hour only recomputes what is missing.
+    """
+    def __init__(self, stages, max_slots=2):
+        self.stages = stages
+        self.max_slots = max_slots
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, slot, name):
+        with self._lock:
+            return self._cache.get(slot, {}).get(name)
+
+    def _store(self, slot, name, output):
+        with self._lock:
+            self._cache.setdefault(slot, {})[name] = output
+            self._cache.move_to_end(slot)
+            while len(self._cache) > self.max_slots:
+                self._cache.popitem(last=False)
+
+    def run(self, now=None, until=None, refresh=False):
+        """
+        Run the stages in order (up to and including `until`) and return the PipelineRun
+        """
+        now = to_ist(now)
+        slot = hour_slot(now)
+        run = PipelineRun(now, slot)
+
+        data = None
+        for stage in self.stages:
+            with instrumentation.measure(stage.name, data, run.diagnostics) as measured:
+                output = None if refresh or not stage.cacheable else self._cached(slot, stage.name)
+                if output is not None:
+                    run.cache_hits.add(stage.name)
+                    measured['cached'] = True
+                else:
+                    output = stage.func(data, now)
+                    if stage.cacheable:
+                        self._store(slot, stage.name, output)
+                measured['output'] = output
+            run.timings[stage.name] = run.records[-1]['wall_s']
+            run.outputs[stage.name] = output
+            data = output
+
+            cached = " (cached)" if stage.name in run.cache_hits else ""
+            print(f"⏱️ {stage.name}: {run.timings[stage.name]:.3f}s{cached}")
+            if stage.name == until:
+                break
+
+        return run
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def build_pipeline(mode=FETCH_MODE, city=None):
+    """
+    Default stage list for a fetch mode ('rows' or 'hourly') and a catalog city
+    """
+    city = get_city(city).key
+    if mode == 'hourly':
+        head = [Stage('fetch_counts', fetch_counts_stage)]
+    else:
+        head = [
+            Stage('fetch', fetch_stage),
+            Stage('parse', parse_stage),
+            Stage('geofence', geofence_stage),
+            Stage('aggregate', aggregate_stage),
+        ]
+    stages = head + [
+        Stage('lags', lag_stage),
+        Stage('weather', weather_stage),
+        Stage('validate', validate_stage),
+        Stage('predict', predict_stage),
+    ]
+    return Pipeline([Stage(stage.name, partial(stage.func, city=city), stage.cacheable) for stage in stages])
+
+
+_pipelines = {}
+_pipeline_lock = threading.Lock()
+_flight = SingleFlight()
+
+
+def get_pipeline(city=None):
+    """
+    The shared pipeline of a city, one per city in the process
+    """
+    city = get_city(city).key
+    with _pipeline_lock:
+        if city not in _pipelines:
+            _pipelines[city] = build_pipeline(city=city)
+        return _pipelines[city]
+
+
+def run_pipeline(now=None, until=None, refresh=False, city=None):
+    """
+    Run a city's shared pipeline for `now` (IST, defaults to the current time).
+    Concurrent calls for the same city and hour slot share a single run.
+    """
+    now = to_ist(now)
+    city = get_city(city).key
+    key = (city, hour_slot(now), until, refresh)
+    return _flight.do(key, lambda: get_pipeline(city).run(now, until=until, refresh=refresh))
+
+
+def run_forecast(now=None, hours=HORIZON_HOURS, refresh=False, run=None, city=None):
+    """
+    Corrected predictions for each of the next `hours` hours, as an (hour x zone) frame.
+    Reuses the slot's cached count matrix and current weather (or those of `run`, a finished
+    PipelineRun of the same city), so it costs `hours` batched model calls.
+    """
+    import model_predict
+
+    zones = get_city(city)
+    if run is None:
+        run = run_pipeline(now, until='weather', refresh=refresh, city=zones.key)
+    counts_stage = list(run.outputs)[list(run.outputs).index('lags') - 1]
+
+    with instrumentation.measure('forecast', run.outputs[counts_stage], run.diagnostics, hours=hours) as measured:
+        raw = recursive_forecast(
+            run.outputs[counts_stage],
+            zones.weather_locations(),
+            run.slot,
+            hours=hours,
+            current_weather=run.outputs['weather'],
+        )
+        forecast = model_predict.correct_zone_matrix(raw, zones.city_zone)
+        measured['output'] = forecast
+    print(f"⏱️ forecast ({hours}h): {run.diagnostics['stages'][-1]['wall_s']:.3f}s")
+    return forecast
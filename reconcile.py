@@ -0,0 +1,126 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Share of the city total left to the modelled zones when they have to be scaled down
+ZONE_SHARE = 0.8
+
+# 'capped' is the original rule: scale zones to 80% of the city only when they overshoot it
+METHODS = ['capped', 'proportional', 'bottom_up', 'ols']
+RECONCILE_METHOD = os.environ.get('SNAPE_RECONCILE_METHOD', 'capped')
+
+# Relative slack allowed by check_coherent for floating point rounding
+TOLERANCE = 1e-9
+
+
+def _split(matrix, city_index):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    city_index = city_index % matrix.shape[1]
+    return np.delete(matrix, city_index, axis=1), matrix[:, city_index], city_index
+
+
+def _join(zones, city, city_index):
+    return np.insert(zones, city_index, city, axis=1)
+
+
+def capped(zones, city, share=ZONE_SHARE):
+    """
+    Hours whose zones add up to more than the city get their zones scaled to `share` of the city
+    """
+    zone_sum = zones.sum(axis=1)
+    over = zone_sum > city
+    factor = np.where(over, share * city / np.where(over, zone_sum, 1.0), 1.0)
+    return zones * factor[:, None], city
+
+
+def proportional(zones, city, share=ZONE_SHARE):
+    """
+    Top-down: zones keep their mix and are scaled down just enough to fit in `share` of the city
+    """
+    zone_sum = zones.sum(axis=1)
+    limit = share * city
+    over = zone_sum > limit
+    factor = np.where(over, limit / np.where(over, zone_sum, 1.0), 1.0)
+    return zones * factor[:, None], city
+
+
+def bottom_up(zones, city, share=ZONE_SHARE):
+    """
+    Zones are trusted as they are; the city is raised where it is below their sum
+    """
+    return zones, np.maximum(city, zones.sum(axis=1))
+
+
+def ols(zones, city, share=ZONE_SHARE, weights=None):
+    """
+    MinT-style projection: city = sum(zones) + other areas, with other areas >= 0.
+
+    Where the base forecasts already satisfy that they are the least-squares
+    answer and stay as they are. Elsewhere other areas is 0 and the excess is
+    shared between city and zones in proportion to `weights` (error variances
+    per column, city last; ones give OLS), keeping zones at or above 0.
+    """
+    n_zones = zones.shape[1]
+    weights = np.ones(n_zones + 1) if weights is None else np.asarray(weights, dtype=np.float64)
+    zone_weights, city_weight = weights[:n_zones], weights[n_zones]
+
+    over = zones.sum(axis=1) > city
+    if not over.any():
+        return zones, city
+    base = zones[over]
+    free = np.ones_like(base, dtype=bool)
+    # Zones pushed below 0 are pinned there and the rest re-solved; at most one pass per zone
+    for _ in range(n_zones):
+        gap = city[over] - np.where(free, base, 0.0).sum(axis=1)
+        shift = gap / (city_weight + np.where(free, zone_weights, 0.0).sum(axis=1))
+        solved = np.where(free, base + zone_weights * shift[:, None], 0.0)
+        negative = solved < 0
+        if not negative.any():
+            break
+        free &= ~negative
+
+    zones = zones.copy()
+    city = city.copy()
+    zones[over] = np.maximum(solved, 0.0)
+    city[over] = zones[over].sum(axis=1)
+    return zones, city
+
+
+RECONCILERS = {'capped': capped, 'proportional': proportional, 'bottom_up': bottom_up, 'ols': ols}
+
+
+def reconcile(matrix, method=RECONCILE_METHOD, city_index=-1, share=ZONE_SHARE, weights=None):
+    """
+    Reconcile an (hours x series) matrix of forecasts, one column of which is the city total,
+    so that every hour's zones add up to no more than its city. Returns a new float64 matrix.
+    """
+    if method not in RECONCILERS:
+        raise ValueError(f"Unknown reconciliation method {method!r}; choose from {METHODS}")
+    zones, city, city_index = _split(matrix, city_index)
+    if method == 'ols':
+        zones, city = ols(zones, city, share, weights)
+    else:
+        zones, city = RECONCILERS[method](zones, city, share)
+    return _join(zones, city, city_index)
+
+
+def reconcile_frame(frame, method=RECONCILE_METHOD, city_zone=None, **kwargs):
+    """
+    reconcile() on an (hour x zone) DataFrame with a `city_zone` column
+    (the zone catalog's default city's when None)
+    """
+    if city_zone is None:
+        from zone_catalog import get_zone_catalog
+        city_zone = get_zone_catalog().city().city_zone
+    reconciled = reconcile(frame.to_numpy(), method, list(frame.columns).index(city_zone), **kwargs)
+    return pd.DataFrame(reconciled, index=frame.index, columns=frame.columns)
+
+
+def check_coherent(matrix, city_index=-1, tolerance=TOLERANCE):
+    """
+    True when no hour's zones add up to more than its city total and nothing is negative
+    """
+    zones, city, _ = _split(matrix, city_index)
+    return bool((zones.sum(axis=1) <= city * (1 + tolerance) + tolerance).all() and (zones >= 0).all() and (city >= 0).all())
@@ -0,0 +1,115 @@
+import time
+import threading
+from datetime import timedelta
+
+from snapshot_store import snapshot_store
+from timeslots import hour_slot, ist_now, to_ist
+from zone_catalog import get_zone_catalog
+
+# Minute of every hour at which the next hour's predictions are precomputed
+PRECOMPUTE_MINUTE = 55
+
+# Minute past the hour at which the current slot is recomputed from its own first bookings
+REFRESH_MINUTE = 5
+
+
+def next_run_time(now, minute=PRECOMPUTE_MINUTE):
+    run_at = now.replace(minute=minute, second=0, microsecond=0)
+    return run_at if run_at > now else run_at + timedelta(hours=1)
+
+
+class PredictionScheduler:
+    """
+    Runs the pipeline ahead of the top of the hour and writes snapshots that the dashboard reads.
+
+    At :55 it computes the upcoming hour's slot. That snapshot is provisional: the slot has
+    no bookings yet, so every zone's current-hour demand `y` is 0. At :05 the slot is
+    recomputed as of then and replaces it. On start (or on demand) it fills the current
+    slot if it has no snapshot yet, or only a provisional one past the refresh minute.
+    Every run covers each of `cities` (catalog keys; the default city when None).
+    """
+    def __init__(self, store=snapshot_store, minute=PRECOMPUTE_MINUTE, refresh_minute=REFRESH_MINUTE, cities=None):
+        self.store = store
+        self.minute = minute
+        self.refresh_minute = refresh_minute
+        self.cities = [get_zone_catalog().city(city).key for city in cities or [None]]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, slot=None, now=None, city=None):
+        """
+        Compute and store a city's predictions for `slot` (defaults to the hour of `now`);
+        `city` defaults to the first of the scheduler's cities.
+
+        A slot still ahead of `now` is run as of its first instant, so it gets the
+        same calendar, lags and forecast hours as a live run in that slot would,
+        from the bookings there are up to `now`; its snapshot is marked provisional.
+        """
+        from pipeline import run_pipeline, run_forecast
+        from forecast import forecast_to_dict
+
+        now = to_ist(now)
+        slot = slot or hour_slot(now)
+        city = get_zone_catalog().city(city or self.cities[0]).key
+        run_at = max(now, slot)
+        print(f"⏰ Precomputing {city} predictions for slot {slot:%Y-%m-%d %H:00}")
+        run = run_pipeline(run_at, refresh=True, city=city)
+        try:
+            # Reuses the run's stage outputs, so this only adds the recursive model calls
+            forecast = forecast_to_dict(run_forecast(run_at, run=run, city=city))
+        except Exception as e:
+            print(f"⚠️ Forecast failed, storing next-hour predictions only: {e}")
+            forecast = None
+        return self.store.write(slot, run.predicted_values, run.timings, forecast, run.diagnostics,
+                                provisional=run_at > now, city=city)
+
+    def ensure_current(self, now=None, city=None):
+        now = to_ist(now)
+        slot = hour_slot(now)
+        city = city or self.cities[0]
+        snapshot = self.store.read(slot, city)
+        stale = snapshot is not None and snapshot.get('provisional') and now.minute >= self.refresh_minute
+        if snapshot is None or stale:
+            snapshot = self.run_once(slot, now, city)
+        return snapshot
+
+    def next_run(self, now):
+        """
+        (time, slot) of the next scheduled run: the refresh of the current slot or the upcoming slot's precompute
+        """
+        refresh_at = next_run_time(now, self.refresh_minute)
+        precompute_at = next_run_time(now, self.minute)
+        if refresh_at < precompute_at:
+            return refresh_at, hour_slot(refresh_at)
+        return precompute_at, hour_slot(precompute_at) + timedelta(hours=1)
+
+    def run_forever(self):
+        for city in self.cities:
+            self.ensure_current(city=city)
+        while not self._stop.is_set():
+            now = ist_now()
+            run_at, slot = self.next_run(now)
+            if self._stop.wait((run_at - now).total_seconds()):
+                break
+            failed = False
+            for city in self.cities:
+                try:
+                    self.run_once(slot, run_at, city)
+                except Exception as e:
+                    print(f"❌ Scheduled {city} run failed: {e}")
+                    failed = True
+            if failed:
+                time.sleep(30)
+
+    def start(self):
+        """
+        Run the schedule in a daemon thread inside the current process
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='prediction-scheduler', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
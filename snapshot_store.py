@@ -0,0 +1,106 @@
+import os
+import json
+import glob
+import time
+from datetime import datetime
+
+from zone_catalog import get_zone_catalog
+
+SNAPSHOT_DIR = os.environ.get(
+    'SNAPE_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots'),
+)
+
+# Versions kept per slot, and slots kept per city
+KEEP_VERSIONS = 3
+KEEP_SLOTS = 48
+
+
+def slot_key(slot):
+    return slot.strftime('%Y%m%dT%H')
+
+
+class SnapshotStore:
+    """
+    Versioned prediction snapshots on local disk, one directory per catalog city
+    and one entry per IST hour slot in it.
+
+    Writers create a new numbered version and atomically repoint `<city>/<slot>.json`
+    at it, so readers only ever open one small file and never see a partial write.
+    Schedulers of different cities can share the directory.
+    """
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+
+    def _city_dir(self, city):
+        return os.path.join(self.directory, get_zone_catalog().city(city).key)
+
+    def _current_path(self, slot, city):
+        return os.path.join(self._city_dir(city), f'{slot_key(slot)}.json')
+
+    def _version_paths(self, slot, city):
+        return sorted(
+            glob.glob(os.path.join(self._city_dir(city), 'versions', f'{slot_key(slot)}.v*.json')),
+            key=lambda path: int(path.rsplit('.v', 1)[1].split('.')[0]),
+        )
+
+    def write(self, slot, predicted_values, timings=None, forecast=None, diagnostics=None, provisional=False, city=None):
+        """
+        Store a city's predictions (and optionally the multi-hour forecast and the run's stage
+        records) for a slot as a new version and make it the current one. A provisional snapshot
+        was computed before the slot began and is expected to be replaced by a later version.
+        `city` defaults to the zone catalog's default city.
+        """
+        city = get_zone_catalog().city(city).key
+        os.makedirs(os.path.join(self._city_dir(city), 'versions'), exist_ok=True)
+        versions = self._version_paths(slot, city)
+        version = int(versions[-1].rsplit('.v', 1)[1].split('.')[0]) + 1 if versions else 1
+
+        snapshot = {
+            'city': city,
+            'slot': slot.isoformat(),
+            'version': version,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'provisional': bool(provisional),
+            'predictions': {zone: float(value) for zone, value in predicted_values.items()},
+            'timings': timings or {},
+        }
+        if forecast is not None:
+            snapshot['forecast'] = forecast
+        if diagnostics is not None:
+            snapshot['diagnostics'] = diagnostics
+        version_path = os.path.join(self._city_dir(city), 'versions', f'{slot_key(slot)}.v{version}.json')
+        tmp_path = f'{self._current_path(slot, city)}.{os.getpid()}.{time.monotonic_ns()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+        with open(version_path, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(tmp_path, self._current_path(slot, city))
+
+        self._prune(slot, city)
+        print(f"💾 Snapshot v{version} written for {city} slot {slot_key(slot)}")
+        return snapshot
+
+    def read(self, slot, city=None):
+        """
+        Current snapshot of a city (the catalog's default city when None) for a slot,
+        or None if nothing was precomputed
+        """
+        try:
+            with open(self._current_path(slot, city)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _prune(self, slot, city):
+        for path in self._version_paths(slot, city)[:-KEEP_VERSIONS]:
+            os.remove(path)
+        current = sorted(glob.glob(os.path.join(self._city_dir(city), '*.json')))
+        for path in current[:-KEEP_SLOTS]:
+            key = os.path.basename(path)[:-len('.json')]
+            os.remove(path)
+            for version_path in glob.glob(os.path.join(self._city_dir(city), 'versions', f'{key}.v*.json')):
+                os.remove(version_path)
+
+
+snapshot_store = SnapshotStore()
@@ -0,0 +1,26 @@
+from datetime import datetime
+import pytz
+
+IST = pytz.timezone('Asia/Kolkata')
+
+
+def ist_now():
+    """
+    Current time in IST as a naive datetime, the convention the fetch stage expects
+    """
+    return datetime.now(IST).replace(tzinfo=None)
+
+
+def to_ist(now):
+    if now is None:
+        return ist_now()
+    if now.tzinfo is not None:
+        return now.astimezone(IST).replace(tzinfo=None)
+    return now
+
+
+def hour_slot(now):
+    """
+    The IST hour a run belongs to; caches and snapshots are keyed on it
+    """
+    return to_ist(now).replace(minute=0, second=0, microsecond=0)
@@ -1,30 +1,106 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import streamlit as st
-from laggeddata import *
 
 # Get API key from secrets
 try:
     API_KEY = st.secrets["WEATHER_API"]["OPENWEATHERMAP_API_KEY"]
     print("✅ Weather API key loaded from secrets")
-except KeyError:
+except (KeyError, FileNotFoundError):
     API_KEY =  "19e278de393d960528df5972d5882d46" # Replace with your actual API key for testing
     print("⚠️ Weather API key not found in secrets, using fallback")
 
-# OpenWeatherMap API Configuration
-BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
+# OpenWeatherMap API Configuration (overridable, e.g. to point at a local stub server)
+BASE_URL = os.environ.get('OPENWEATHER_BASE_URL', "https://api.openweathermap.org/data/2.5/weather")
+# 5 day / 3 hour forecast, used for hours beyond the next one
+FORECAST_URL = os.environ.get('OPENWEATHER_FORECAST_URL', "https://api.openweathermap.org/data/2.5/forecast")
 
-# Coordinates for each location (lat, lon)
-locations = {
-    'kolkata': {'lat': 22.5726, 'lon': 88.3639, 'name': 'Kolkata'},
-    'howrah': {'lat': 22.5958, 'lon': 88.2636, 'name': 'Howrah'},
-    'sectorV': {'lat': 22.5761, 'lon': 88.4355, 'name': 'Sector V'},
-    'airport': {'lat': 22.6542, 'lon': 88.4467, 'name': 'Airport'},
-    'rabindrasadan': {'lat': 22.5412, 'lon': 88.3476, 'name': 'Rabindra Sadan'},
-    'laketown': {'lat': 22.6041, 'lon': 88.4037, 'name': 'Lake Town'}
-}
+# Seconds a reading is fresh, and how much longer it may be served while a refresh runs
+WEATHER_TTL = int(os.environ.get('WEATHER_TTL_SECONDS', 600))
+WEATHER_STALE_TTL = int(os.environ.get('WEATHER_STALE_TTL_SECONDS', 3600))
+
+# Pooled keep-alive connections shared by every weather request in the process
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Model input columns, in the order the scalers were fitted on
+FEATURE_COLUMNS = ['y', 'rain_intensity', 'rain_accumulation', 'temperature', 'lag_1', 'lag_8', 'lag_12', 'lag_24']
+
+# Used when the API call fails
+FALLBACK_WEATHER = {'temperature': 25.0, 'rain_intensity': 0.0, 'rain_accumulation': 0.0}
+
+class WeatherCache:
+    """
+    Per-coordinate TTL cache with stale-while-revalidate.
+
+    Fresh entries are returned as is. Entries past the TTL but within the stale
+    window are returned immediately while one background refresh runs. Anything
+    older (or missing) is fetched synchronously. Failed fetches are not cached.
+    """
+    def __init__(self, ttl=WEATHER_TTL, stale_ttl=WEATHER_STALE_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(lat, lon):
+        return (round(lat, 4), round(lon, 4))
+
+    def _store(self, key, value):
+        if value is not None:
+            with self._lock:
+                self._entries[key] = (self.clock(), value)
+        return value
+
+    def _refresh(self, key, fetch):
+        try:
+            self._store(key, fetch())
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key, fetch):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            age = self.clock() - entry[0]
+            if age < self.ttl:
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                with self._lock:
+                    start_refresh = key not in self._refreshing
+                    self._refreshing.add(key)
+                if start_refresh:
+                    threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+                return entry[1]
+        return self._store(key, fetch())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+weather_cache = WeatherCache()
 
 def get_weather_data(lat, lon, location_name):
+    """
+    Get weather data for a coordinate, served from the TTL cache when possible
+    """
+    return weather_cache.get(
+        WeatherCache.key(lat, lon),
+        lambda: fetch_weather_data(lat, lon, location_name),
+    )
+
+def fetch_weather_data(lat, lon, location_name):
     """
     Get weather data from OpenWeatherMap API
     """
@@ -36,7 +112,7 @@ def get_weather_data(lat, lon, location_name):
             'units': 'metric'  # For Celsius temperature
         }
         
-        response = requests.get(BASE_URL, params=params, timeout=10)
+        response = session.get(BASE_URL, params=params, timeout=10)
         response.raise_for_status()
         data = response.json()
         
@@ -66,80 +142,114 @@ def get_weather_data(lat, lon, location_name):
         print(f"❌ Unexpected error for {location_name}: {e}")
         return None
 
-def add_weather_data_to_dataframe(df, lat, lon, location_name):
+def get_weather_forecast(lat, lon, location_name):
     """
-    Add weather data to a dataframe with fallback values
+    3-hourly forecast entries for a coordinate, served from the TTL cache when possible
+    """
+    return weather_cache.get(
+        ('forecast',) + WeatherCache.key(lat, lon),
+        lambda: fetch_weather_forecast(lat, lon, location_name),
+    )
+
+def fetch_weather_forecast(lat, lon, location_name):
+    """
+    Get the OpenWeatherMap 3-hourly forecast as a list of (UTC epoch seconds, weather_info)
     """
     try:
-        weather_data = get_weather_data(lat, lon, location_name)
-        
-        if weather_data:
-            df['temperature'] = weather_data['temperature']
-            df['rain_intensity'] = weather_data['rain_intensity']
-            df['rain_accumulation'] = weather_data['rain_accumulation']
-        else:
+        params = {'lat': lat, 'lon': lon, 'appid': API_KEY, 'units': 'metric'}
+        response = session.get(FORECAST_URL, params=params, timeout=10)
+        response.raise_for_status()
+
+        entries = []
+        for item in response.json()['list']:
+            # Spread the 3h rain volume evenly so it matches the 1h values the model was trained on
+            rain = item.get('rain', {}).get('3h', 0.0) / 3
+            entries.append((item['dt'], {
+                'temperature': item['main']['temp'],
+                'rain_intensity': rain,
+                'rain_accumulation': rain,
+            }))
+        print(f"✅ Weather forecast fetched for {location_name}: {len(entries)} entries")
+        return entries
+
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Error fetching weather forecast for {location_name}: {e}")
+        return None
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"❌ Unexpected forecast response format for {location_name}: {e}")
+        return None
+
+def weather_for_hours(location, hours_utc):
+    """
+    Weather for each target hour (UTC epoch seconds) at a location ({"lat", "lon", "name"}).
+
+    Uses the nearest forecast entry; falls back to the current reading, then to
+    FALLBACK_WEATHER, when no forecast is available.
+    """
+    entries = get_weather_forecast(location['lat'], location['lon'], location['name'])
+    if not entries:
+        current = get_weather_data(location['lat'], location['lon'], location['name']) or FALLBACK_WEATHER
+        print(f"⚠️ No forecast for {location['name']}, holding current weather")
+        return [current] * len(hours_utc)
+    times = [t for t, _ in entries]
+    return [entries[min(range(len(times)), key=lambda i: abs(times[i] - hour))][1] for hour in hours_utc]
+
+def _by_point(locations):
+    # Zones sharing a weather point are fetched once
+    return {WeatherCache.key(loc['lat'], loc['lon']): loc for loc in locations.values()}
+
+def forecast_for_locations(locations, hours_utc):
+    """
+    Fetch forecasts for every location ({key: {"lat", "lon", "name"}}) concurrently.
+    Returns {key: [weather_info per hour in hours_utc]}.
+    """
+    points = _by_point(locations)
+    with ThreadPoolExecutor(max_workers=max(1, len(points))) as executor:
+        futures = {point: executor.submit(weather_for_hours, loc, hours_utc) for point, loc in points.items()}
+        by_point = {point: future.result() for point, future in futures.items()}
+    return {key: by_point[WeatherCache.key(loc['lat'], loc['lon'])] for key, loc in locations.items()}
+
+def fetch_weather_for_locations(locations):
+    """
+    Fetch weather for every location ({key: {"lat", "lon", "name"}}) concurrently.
+    Returns {key: weather_info or None}.
+    """
+    points = _by_point(locations)
+    with ThreadPoolExecutor(max_workers=max(1, len(points))) as executor:
+        futures = {
+            point: executor.submit(get_weather_data, loc['lat'], loc['lon'], loc['name'])
+            for point, loc in points.items()
+        }
+        by_point = {point: future.result() for point, future in futures.items()}
+    return {key: by_point[WeatherCache.key(loc['lat'], loc['lon'])] for key, loc in locations.items()}
+
+def add_weather_features(features, zone_locations):
+    """
+    Add temperature and rain columns to a per-zone feature frame, with fallback values.
+    `zone_locations` maps each row (zone) of `features` to its weather point (see zone_catalog).
+    """
+    print("🌤️ Fetching weather data for all locations...")
+    weather_by_location = fetch_weather_for_locations({zone: zone_locations[zone] for zone in features.index})
+
+    features = features.copy()
+    for zone in features.index:
+        location = zone_locations[zone]
+        weather_data = weather_by_location.get(zone)
+        if not weather_data:
             # Fallback values if API fails
-            df['temperature'] = 25.0
-            df['rain_intensity'] = 0.0
-            df['rain_accumulation'] = 0.0
-            print(f"⚠️ Using fallback weather data for {location_name}")
-            
-    except Exception as e:
-        print(f"❌ Error adding weather data to {location_name}: {e}")
-        # Fallback values
-        df['temperature'] = 25.0
-        df['rain_intensity'] = 0.0
-        df['rain_accumulation'] = 0.0
-
-# Add weather data to all dataframes
-print("🌤️ Fetching weather data for all locations...")
-
-add_weather_data_to_dataframe(
-    hourly_demand, 
-    locations['kolkata']['lat'], 
-    locations['kolkata']['lon'], 
-    locations['kolkata']['name']
-)
-
-add_weather_data_to_dataframe(
-    hourly_demand_rabindrasadan, 
-    locations['rabindrasadan']['lat'], 
-    locations['rabindrasadan']['lon'], 
-    locations['rabindrasadan']['name']
-)
-
-add_weather_data_to_dataframe(
-    hourly_demand_laketown, 
-    locations['laketown']['lat'], 
-    locations['laketown']['lon'], 
-    locations['laketown']['name']
-)
-
-add_weather_data_to_dataframe(
-    hourly_demand_airpot, 
-    locations['airport']['lat'], 
-    locations['airport']['lon'], 
-    locations['airport']['name']
-)
-
-add_weather_data_to_dataframe(
-    hourly_demand_howrah, 
-    locations['howrah']['lat'], 
-    locations['howrah']['lon'], 
-    locations['howrah']['name']
-)
-
-add_weather_data_to_dataframe(
-    hourly_demand_sectorV, 
-    locations['sectorV']['lat'], 
-    locations['sectorV']['lon'], 
-    locations['sectorV']['name']
-)
+            weather_data = FALLBACK_WEATHER
+            print(f"⚠️ Using fallback weather data for {location['name']}")
+        for column, value in weather_data.items():
+            features.loc[zone, column] = value
+
+    features = safe_column_selection(features, "features")
+    print("🌤️ Weather data processing completed!", features.shape)
+    return features
 
 # Select relevant columns with error handling
 def safe_column_selection(df, zone_name):
     try:
-        required_cols = ['y', 'rain_intensity', 'rain_accumulation', 'temperature', 'lag_1', 'lag_8', 'lag_12', 'lag_24']
+        required_cols = FEATURE_COLUMNS
         available_cols = [col for col in required_cols if col in df.columns]
         
         if len(available_cols) < len(required_cols):
@@ -150,19 +260,3 @@ def safe_column_selection(df, zone_name):
     except Exception as e:
         print(f"❌ Error selecting columns for {zone_name}: {e}")
         return df
-
-# Apply column selection to all dataframes
-hourly_demand = safe_column_selection(hourly_demand, "city")
-hourly_demand_airpot = safe_column_selection(hourly_demand_airpot, "airport")
-hourly_demand_laketown = safe_column_selection(hourly_demand_laketown, "laketown")
-hourly_demand_howrah = safe_column_selection(hourly_demand_howrah, "howrah")
-hourly_demand_rabindrasadan = safe_column_selection(hourly_demand_rabindrasadan, "rabindrasadan")
-hourly_demand_sectorV = safe_column_selection(hourly_demand_sectorV, "sectorV")
-
-print("🌤️ Weather data processing completed!")
-print("city", hourly_demand.shape)
-print("laketown", hourly_demand_laketown.shape)
-print("airport", hourly_demand_airpot.shape)
-print('howrah', hourly_demand_howrah.shape)
-print('rabindrasadan', hourly_demand_rabindrasadan.shape)
-print('sector5', hourly_demand_sectorV.shape)
\ No newline at end of file
@@ -0,0 +1,134 @@
+import os
+import json
+import threading
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+ZONE_CATALOG_PATH = os.environ.get('SNAPE_ZONE_CATALOG', os.path.join(ROOT, 'zone_catalog.json'))
+
+# City served when none is named; the catalog's default_city when unset
+DEFAULT_CITY = os.environ.get('SNAPE_CITY')
+
+
+class City:
+    """
+    One city of the zone catalog: its geofenced zones plus the city-wide total.
+
+    Every zone (and the city total) has a weather point, a model artifact name
+    and a display name. Zone keys double as count columns, model zones and
+    weather keys, so nothing downstream needs a mapping between them. The city
+    total counts every booking unless the catalog gives it a center and radius,
+    which it must once the catalog has more than one city.
+    """
+    def __init__(self, key, config, root=ROOT):
+        self.key = key
+        self.display_name = config.get('display_name', key)
+        self.model_dir = os.path.join(root, config.get('model_dir', 'models'))
+        self.city = config['city']
+        self.city_zone = self.city['key']
+        self.zones = dict(config['zones'])
+        self.entries = {**self.zones, self.city_zone: self.city}
+
+    @property
+    def bounded(self):
+        return 'center' in self.city
+
+    @property
+    def zone_names(self):
+        """
+        Geofenced keys, in bit order of the booking zone mask
+        """
+        return list(self.zones) + ([self.city_zone] if self.bounded else [])
+
+    @property
+    def model_zones(self):
+        """
+        Every zone with a model, the city total last
+        """
+        return list(self.zones) + [self.city_zone]
+
+    def geofences(self):
+        """
+        {zone: {"lat", "lon", "radius_km"}} for geofence.ZoneIndex and the BigQuery aggregation
+        """
+        return {
+            zone: {'lat': self.entries[zone]['center']['lat'], 'lon': self.entries[zone]['center']['lon'],
+                   'radius_km': self.entries[zone]['radius_km']}
+            for zone in self.zone_names
+        }
+
+    def weather_locations(self):
+        """
+        {zone: {"lat", "lon", "name"}} where each model zone's weather is read
+        """
+        return {zone: self.entries[zone]['weather'] for zone in self.model_zones}
+
+    def display_names(self):
+        return {zone: entry.get('display_name', zone) for zone, entry in self.entries.items()}
+
+    def model_name(self, zone):
+        """
+        Artifact name of a zone's model: models/lstm_<name>.h5, scaler_x_<name>.pkl, ...
+        """
+        return self.entries[zone].get('model', zone)
+
+
+class ZoneCatalog:
+    def __init__(self, config, root=ROOT):
+        self.cities = {key: City(key, city, root) for key, city in config['cities'].items()}
+        self.default_city = config.get('default_city') or next(iter(self.cities), None)
+        self._validate()
+        self._zone_city = {zone: city for city in self.cities.values() for zone in city.entries}
+
+    def _validate(self):
+        seen = {}
+        for city in self.cities.values():
+            # The bookings table is shared, so a city total without bounds would count every city
+            if len(self.cities) > 1 and not city.bounded:
+                raise ValueError(f"City total {city.city_zone!r} of {city.key!r} needs a center and radius_km"
+                                 " when the catalog has more than one city")
+            for zone, entry in city.entries.items():
+                if zone in seen:
+                    raise ValueError(f"Zone {zone!r} is defined in both {seen[zone]!r} and {city.key!r}")
+                seen[zone] = city.key
+                missing = [field for field in ('weather',) + (('center', 'radius_km') if zone in city.zone_names else ())
+                           if field not in entry]
+                if missing:
+                    raise ValueError(f"Zone {zone!r} in {city.key!r} is missing {', '.join(missing)}")
+
+    def city(self, key=None):
+        """
+        A City by key; DEFAULT_CITY (or the catalog's default) when none is given
+        """
+        key = key or DEFAULT_CITY or self.default_city
+        if key not in self.cities:
+            raise KeyError(f"Unknown city {key!r}; the catalog has {list(self.cities)}")
+        return self.cities[key]
+
+    def city_for(self, zone):
+        """
+        The City a zone (or city total) belongs to, or None
+        """
+        return self._zone_city.get(zone)
+
+
+def load_zone_catalog(path=ZONE_CATALOG_PATH):
+    with open(path) as f:
+        return ZoneCatalog(json.load(f), os.path.dirname(os.path.abspath(path)))
+
+
+_catalog_cache = {}
+_catalog_lock = threading.Lock()
+
+
+def get_zone_catalog(path=ZONE_CATALOG_PATH):
+    """
+    ZoneCatalog for a file, read once and reloaded when the file changes
+    """
+    mtime = os.path.getmtime(path)
+    with _catalog_lock:
+        cached = _catalog_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, load_zone_catalog(path))
+            _catalog_cache[path] = cached
+        return cached[1]